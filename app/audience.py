@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import re
+import logging
+from threading import Lock
+
+
+create_cache_versions = """
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        name VARCHAR PRIMARY KEY,
+        version INT NOT NULL DEFAULT 0
+);
+"""
+
+
+def genre_key(genre):
+    """Genre of a section as it is keyed in config.genres, e.g. DRUM & BASS / JUNGLE -> drum_bass_jungle"""
+    return re.sub(r" / |-| & |\s+|% ", "_", genre).lower()
+
+
+class AudienceIndex:
+    """In-process genre -> active subscribers' chat IDs index.
+    Every process keeps its own copy and checks a version row in the database before using it.
+    Writers bump the version in the same transaction as the change, so all uWSGI processes,
+    dispatcher and parser see subscription changes on their next lookup"""
+    name = "audience"
+
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        self.index = dict()
+
+    @staticmethod
+    def create_table(db_cursor):
+        db_cursor.execute(create_cache_versions)
+        db_cursor.execute(
+            "INSERT INTO cache_versions (name, version) VALUES (?, 0) ON CONFLICT DO NOTHING", (AudienceIndex.name,)
+        )
+
+    @staticmethod
+    def invalidate(db_cursor):
+        """Mark index stale in every process. Called by writers of users and user_subscriptions before commit"""
+        db_cursor.execute("UPDATE cache_versions SET version = version + 1 WHERE name = ?", (AudienceIndex.name,))
+
+    @staticmethod
+    def current_version(db_cursor):
+        db_cursor.execute("SELECT version FROM cache_versions WHERE name = ?", (AudienceIndex.name,))
+        row = db_cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def build(db_cursor):
+        """All active subscriptions in one scan"""
+        db_cursor.execute(
+            """
+                SELECT user_subscriptions.genre, users.user_chat_id
+                FROM user_subscriptions
+                JOIN users ON users.user_id = user_subscriptions.user_id
+                WHERE users.is_active = true
+            ;
+            """
+        )
+        index = dict()
+        for genre, user_chat_id in db_cursor.fetchall():
+            index.setdefault(genre, []).append(user_chat_id)
+        return index
+
+    def get(self, db_cursor, genre):
+        """Active users subscribed to genre. Index is rebuilt only if it was invalidated since the last lookup"""
+        version = self.current_version(db_cursor)
+        with self.lock:
+            if version is None or version != self.version:
+                self.index = self.build(db_cursor)
+                #  without version row index can't be trusted across processes, it is rebuilt every time
+                self.version = version
+                logging.debug(f"Audience index rebuilt, version {version}")
+            return list(self.index.get(genre_key(genre), ()))
+
+
+audience_index = AudienceIndex()
@@ -2,19 +2,45 @@
 #
 # -*- coding: utf-8 -*-
 
-import requests
+import json
+import logging
 
 import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, KeyboardButton, ReplyKeyboardMarkup
-from flask import Flask, request, render_template
+from flask import Flask, request, render_template, abort
 
-from config import BOT_TOKEN, ADMIN_CHAT_ID, API_HOST, api_key_headers, genres
+from config import BOT_TOKEN, ADMIN_CHAT_ID, WEBHOOK_SECRET, genres
+from app import services
+from app.updates import UpdateQueue
 from app.api import blueprint
 
 
 bot = telebot.TeleBot(BOT_TOKEN, threaded=False)
 app = Flask(__name__)
 app.register_blueprint(blueprint)
+update_queue = UpdateQueue()
+
+
+def reply_keyboard(*commands):
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add(*[KeyboardButton(command) for command in commands])
+    return keyboard.to_json()
+
+
+def selections_keyboard():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row_width = 1
+    buttons = [InlineKeyboardButton(genres[genre], callback_data=genre) for genre in genres]
+    buttons.append(InlineKeyboardButton("unsubscribe", callback_data="unsubscribe"))
+    keyboard.add(*buttons)
+    return keyboard.to_json()
+
+
+#  static keyboards are serialized once, telebot sends JSON strings as they are
+menu_markup = reply_keyboard("/help", "/selections")
+subscriber_menu_markup = reply_keyboard("/help", "/selections", "/unsubscribe")
+empty_markup = reply_keyboard()
+selections_markup = selections_keyboard()
 
 
 @app.route("/")
@@ -25,8 +51,18 @@ def index():
 
 @app.route("/" + BOT_TOKEN, methods=["POST"])
 def get_message():
-    """Webhook routing: new messages processor"""
-    bot.process_new_updates([telebot.types.Update.de_json(request.stream.read().decode("utf-8"))])
+    """Webhook routing: update is queued and acknowledged at once, updates worker handles it"""
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        abort(403)
+    body = request.get_data(as_text=True)
+    try:
+        update = json.loads(body)
+    except ValueError:
+        abort(400)
+    if not isinstance(update, dict) or not isinstance(update.get("update_id"), int):
+        abort(400)
+    if not update_queue.put(update, body):
+        logging.debug(f"Update {update['update_id']} is already queued")
     return "!", 200
 
 
@@ -40,27 +76,15 @@ def command_start(message):
     username = message.from_user.username
     first_name = message.from_user.first_name
     last_name = message.from_user.last_name
-    #  send user's data to API
-    data = {
-        "user_chat_id": user_chat_id,
-        "username": username,
-        "first_name": first_name,
-        "last_name": last_name
-    }
-    response = requests.put(f"{API_HOST}/start", json=data, headers=api_key_headers)
-    #  introduce_text depended on API response
-    if response.status_code in (200, 201):
+    #  register user, introduce_text depended on result
+    try:
+        services.register_user(user_chat_id, username, first_name, last_name)
         message_text = "Use */selections* to choose genres you want to follow"
-    else:
+    except Exception as e:
+        logging.error(f"Can't register user {user_chat_id}: {e!r}")
         message_text = "Bot is on maintenance mode. Try again later"
-    #  menu buttons
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(
-        KeyboardButton("/help"),
-        KeyboardButton("/selections")
-    )
     #  response
-    bot.send_message(user_chat_id, message_text, reply_markup=keyboard, parse_mode="Markdown")
+    bot.send_message(user_chat_id, message_text, reply_markup=menu_markup, parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["selections"])
@@ -68,15 +92,11 @@ def command_selections(message):
     """/selections command handler"""
     #  get user_chat_id from message to identify user
     user_chat_id = message.chat.id
-    #  menu buttons
-    reply_markup = InlineKeyboardMarkup()
-    reply_markup.row_width = 1
-    buttons = [InlineKeyboardButton(genres[genre], callback_data=genre) for genre in genres]
-    buttons.append(InlineKeyboardButton("unsubscribe", callback_data="unsubscribe"))
-    reply_markup.add(*buttons)
     message_text = "Tap on genres you want to follow"
     #  response
-    bot.send_message(user_chat_id, message_text, reply_markup=reply_markup, parse_mode="Markdown", disable_notification=True)
+    bot.send_message(
+        user_chat_id, message_text, reply_markup=selections_markup, parse_mode="Markdown", disable_notification=True
+    )
 
 
 @bot.callback_query_handler(func=lambda call: True)
@@ -85,16 +105,17 @@ def callback_query(call):
     #  get user_chat_id from message to identify user
     user_chat_id = call.from_user.id
     #  result depended on clicked button
-    data = {
-        "user_chat_id": user_chat_id
-    }
-    if call.data == "unsubscribe":
-        response = requests.put(f"{API_HOST}/unsubscribe", json=data, headers=api_key_headers)
-    else:
-        data["genre"] = call.data
-        response = requests.put(f"{API_HOST}/subscribe", json=data, headers=api_key_headers)
+    try:
+        if call.data == "unsubscribe":
+            services.unsubscribe(user_chat_id)
+            result = "OK. Subscriptions were deleted"
+        else:
+            result = f"OK. Subscribed to {services.subscribe(user_chat_id, call.data)}"
+    except Exception as e:
+        logging.error(f"Can't update subscriptions of {user_chat_id}: {e!r}")
+        result = "There is an error. Please try again later."
     #  response
-    bot.answer_callback_query(call.id, response.json())
+    bot.answer_callback_query(call.id, result)
 
 
 @bot.message_handler(commands=["unsubscribe"])
@@ -103,19 +124,14 @@ def command_unsubscribe(message):
     bot.send_message(message.from_user.id, "Give me a second...")
     #  get user_chat_id from message to identify user
     user_chat_id = message.chat.id
-    #  use API method to start command execution
-    data = {
-        "user_chat_id": user_chat_id
-    }
-    requests.put(f"{API_HOST}/unsubscribe", json=data, headers=api_key_headers)
-    #  menu buttons
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(
-        KeyboardButton("/help"),
-        KeyboardButton("/selections"),
-    )
+    try:
+        services.unsubscribe(user_chat_id)
+        message_text = "You can renew your subscriptions at */selections*"
+    except Exception as e:
+        logging.error(f"Can't unsubscribe {user_chat_id}: {e!r}")
+        message_text = "There is an error. Please try again later."
     #  response
-    bot.send_message(user_chat_id, "You can renew your subscriptions at */selections*", reply_markup=keyboard, parse_mode="Markdown")
+    bot.send_message(user_chat_id, message_text, reply_markup=menu_markup, parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["my_subscriptions"])
@@ -123,29 +139,26 @@ def command_my_subscriptions(message):
     """/my_subscriptions command handler"""
     #  get user_chat_id from message to identify user
     user_chat_id = message.chat.id
-    response = requests.get(f"{API_HOST}/my_subscriptions?user_chat_id={user_chat_id}", headers=api_key_headers)
+    try:
+        subscriptions = services.user_subscriptions(user_chat_id)
+    except Exception as e:
+        logging.error(f"Can't get subscriptions of {user_chat_id}: {e!r}")
+        subscriptions = None
     #  menu buttons
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    #  result depended on API response
+    keyboard = empty_markup
+    #  result depended on user's subscriptions
     my_subscriptions = list()
-    if response.status_code == 200:
-        for key, value in response.json().items():
+    if subscriptions is not None:
+        for key, value in subscriptions.items():
             if value:
                 my_subscriptions.append(f"*{key}*")
         #  info message depended on user's subscriptions
         if bool(my_subscriptions):
             result = "You're subscribed to\n\n" + "\n".join(my_subscriptions)
-            keyboard.add(
-                KeyboardButton("/help"),
-                KeyboardButton("/selections"),
-                KeyboardButton("/unsubscribe")
-            )
+            keyboard = subscriber_menu_markup
         else:
             result = "You're not subscribed to anything yet"
-            keyboard.add(
-                KeyboardButton("/help"),
-                KeyboardButton("/selections")
-            )
+            keyboard = menu_markup
     else:
         result = "There is an error. Please try again later."
     #  response
@@ -158,10 +171,12 @@ def command_stats(message):
     #  get user_chat_id from message to identify user
     user_chat_id = message.chat.id
     if user_chat_id == ADMIN_CHAT_ID:
-        #  use API method to start command execution
-        response = requests.get(f"{API_HOST}/stats", headers=api_key_headers)
-        #  response
-        bot.send_message(user_chat_id, response.json(), parse_mode="Markdown")
+        try:
+            message_text = services.stats_message()
+        except Exception as e:
+            logging.error(f"Can't get stats: {e!r}")
+            message_text = "There is an error. Please try again later."
+        bot.send_message(user_chat_id, message_text, parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["help"])
@@ -169,7 +184,5 @@ def command_help(message):
     """/help command handler"""
     #  get user_chat_id from message to identify user
     user_chat_id = message.chat.id
-    #  text
-    response = requests.get(f"{API_HOST}/help", headers=api_key_headers)
     #  response
-    bot.send_message(user_chat_id, response.json(), parse_mode="Markdown", disable_notification=True)
+    bot.send_message(user_chat_id, services.help_text, parse_mode="Markdown", disable_notification=True)
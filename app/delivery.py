@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import json
+from time import time
+
+from app.db import connect, connection, table_columns, insert_id
+from app.audience import audience_index
+from config import DB_URL, DELIVERY_RETENTION
+
+
+create_delivery_jobs = """
+    CREATE TABLE IF NOT EXISTS delivery_jobs (
+        job_id INTEGER PRIMARY KEY,
+        redeye_id INT NOT NULL,
+        section_table VARCHAR NOT NULL,
+        status VARCHAR NOT NULL DEFAULT 'pending',
+        recipients INT,
+        created_at REAL,
+        started_at REAL,
+        finished_at REAL,
+        payload VARCHAR
+);
+"""
+
+create_deliveries = """
+    CREATE TABLE IF NOT EXISTS deliveries (
+        job_id INT NOT NULL,
+        user_chat_id BIGINT NOT NULL,
+        status VARCHAR NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        error VARCHAR,
+        sent_at REAL,
+        PRIMARY KEY (job_id, user_chat_id)
+);
+"""
+
+#  running totals of deliveries purged with their jobs, by status
+create_delivery_totals = """
+    CREATE TABLE IF NOT EXISTS delivery_totals (
+        status VARCHAR PRIMARY KEY,
+        messages BIGINT NOT NULL DEFAULT 0
+);
+"""
+
+#  release payload fields, in the order dispatcher renders them
+release_fields = ("title", "cat", "tracklist", "price", "release_url", "samples", "genre", "section", "img")
+
+create_delivery_indexes = [
+    "CREATE INDEX IF NOT EXISTS delivery_jobs_status ON delivery_jobs (status, job_id);",
+    "CREATE INDEX IF NOT EXISTS deliveries_status ON deliveries (status, job_id);",
+    "CREATE INDEX IF NOT EXISTS deliveries_sent_at ON deliveries (sent_at);",
+    "CREATE INDEX IF NOT EXISTS delivery_jobs_finished_at ON delivery_jobs (status, finished_at);",
+]
+
+
+class DeliveryQueue:
+    """Persistent queue of release notifications: API enqueues jobs, dispatcher drains them"""
+    def __init__(self, db_url=DB_URL):
+        self.db_url = db_url
+
+    def connect(self):
+        """Dedicated connection for a long running consumer such as dispatcher"""
+        return connect(self.db_url)
+
+    @staticmethod
+    def create_tables(db_cursor):
+        db_cursor.execute(create_delivery_jobs)
+        if "payload" not in table_columns(db_cursor, "delivery_jobs"):
+            db_cursor.execute("ALTER TABLE delivery_jobs ADD COLUMN payload VARCHAR")
+        db_cursor.execute(create_deliveries)
+        db_cursor.execute(create_delivery_totals)
+        for create_index in create_delivery_indexes:
+            db_cursor.execute(create_index)
+
+    def enqueue(self, redeye_id, table):
+        """Queue notification of a release found in section `table`. Returns job ID"""
+        with connection(self.db_url) as db_connection:
+            db_cursor = db_connection.cursor()
+            job_id = insert_id(
+                db_cursor,
+                "INSERT INTO delivery_jobs (redeye_id, section_table, status, created_at) VALUES (?, ?, 'pending', ?)",
+                (redeye_id, table, time()), "job_id"
+            )
+            db_connection.commit()
+        return job_id
+
+    def enqueue_many(self, releases):
+        """Queue notifications of a batch of releases with their full payloads in one transaction.
+        Audience is resolved once per genre and expanded right away. Returns job IDs"""
+        with connection(self.db_url) as db_connection:
+            db_cursor = db_connection.cursor()
+            audiences = dict()
+            job_ids = list()
+            now = time()
+            for release in releases:
+                payload = [release.get(field) for field in release_fields]
+                genre = release["genre"]
+                if genre not in audiences:
+                    audiences[genre] = self.audience(db_cursor, genre)
+                job_id = insert_id(
+                    db_cursor,
+                    """
+                        INSERT INTO delivery_jobs (redeye_id, section_table, status, created_at, payload)
+                        VALUES (?, ?, 'pending', ?, ?)
+                    ;
+                    """, (release["redeye_id"], release["table"], now, json.dumps(payload)), "job_id"
+                )
+                db_cursor.executemany(
+                    "INSERT INTO deliveries (job_id, user_chat_id) VALUES (?, ?)",
+                    [(job_id, user_chat_id) for user_chat_id in audiences[genre]]
+                )
+                db_cursor.execute("UPDATE delivery_jobs SET recipients = ? WHERE job_id = ?", (len(audiences[genre]), job_id))
+                job_ids.append(job_id)
+            db_connection.commit()
+        return job_ids
+
+    @staticmethod
+    def audience(db_cursor, genre):
+        """Active users subscribed to genre"""
+        return audience_index.get(db_cursor, genre)
+
+    @staticmethod
+    def recover(db_connection):
+        """Jobs left in processing by a stopped dispatcher are picked up again"""
+        db_connection.execute("UPDATE delivery_jobs SET status = 'pending' WHERE status = 'processing'")
+        db_connection.commit()
+
+    @staticmethod
+    def oldest_pending(db_connection):
+        """Creation time of the oldest pending job or None"""
+        db_cursor = db_connection.cursor()
+        db_cursor.execute("SELECT min(created_at) FROM delivery_jobs WHERE status = 'pending'")
+        return db_cursor.fetchone()[0]
+
+    @staticmethod
+    def next_jobs(db_connection, limit=1):
+        """Oldest pending jobs as [(job_id, redeye_id, section_table, payload, recipients)]. Marks them as processing"""
+        db_cursor = db_connection.cursor()
+        db_cursor.execute(
+            """
+                SELECT job_id, redeye_id, section_table, payload, recipients
+                FROM delivery_jobs
+                WHERE status = 'pending'
+                ORDER BY job_id
+                LIMIT ?
+            ;
+            """, (limit,)
+        )
+        jobs = db_cursor.fetchall()
+        db_cursor.executemany(
+            "UPDATE delivery_jobs SET status = 'processing', started_at = coalesce(started_at, ?) WHERE job_id = ?",
+            [(time(), job[0]) for job in jobs]
+        )
+        db_connection.commit()
+        return jobs
+
+    @staticmethod
+    def add_recipients(db_connection, job_id, user_chat_ids):
+        """Expand job into one delivery per recipient. Already expanded recipients are kept as they are"""
+        db_connection.executemany(
+            "INSERT INTO deliveries (job_id, user_chat_id) VALUES (?, ?) ON CONFLICT DO NOTHING",
+            [(job_id, user_chat_id) for user_chat_id in user_chat_ids]
+        )
+        db_connection.execute(
+            "UPDATE delivery_jobs SET recipients = (SELECT count(*) FROM deliveries WHERE job_id = ?) WHERE job_id = ?",
+            (job_id, job_id)
+        )
+        db_connection.commit()
+
+    @staticmethod
+    def pending_recipients(db_connection, job_id):
+        db_cursor = db_connection.cursor()
+        db_cursor.execute(
+            "SELECT user_chat_id FROM deliveries WHERE job_id = ? AND status = 'pending' ORDER BY user_chat_id", (job_id,)
+        )
+        return [row[0] for row in db_cursor.fetchall()]
+
+    @staticmethod
+    def mark_many(db_connection, results):
+        """Record a batch of (job_id, user_chat_id, status, error, attempts) results in one transaction"""
+        now = time()
+        db_connection.executemany(
+            """
+                UPDATE deliveries
+                SET status = ?, error = ?, attempts = attempts + ?, sent_at = ?
+                WHERE job_id = ? AND user_chat_id = ?
+            ;
+            """, [
+                (status, error, attempts, now if status == "sent" else None, job_id, user_chat_id)
+                for job_id, user_chat_id, status, error, attempts in results
+            ]
+        )
+        db_connection.commit()
+
+    @staticmethod
+    def finish(db_connection, job_id):
+        db_connection.execute(
+            "UPDATE delivery_jobs SET status = 'done', finished_at = ? WHERE job_id = ?", (time(), job_id)
+        )
+        db_connection.commit()
+
+    @staticmethod
+    def purge(db_connection, retention=DELIVERY_RETENTION):
+        """Forget jobs finished more than `retention` seconds ago with their deliveries, which are added
+        to running totals first. Returns number of jobs purged"""
+        #  finished jobs don't change, so every statement below sees the same ones
+        purged = "SELECT job_id FROM delivery_jobs WHERE status = 'done' AND finished_at < ?"
+        cutoff = (time() - retention,)
+        db_cursor = db_connection.cursor()
+        db_cursor.execute(
+            f"""
+                INSERT INTO delivery_totals (status, messages)
+                SELECT status, count(*) FROM deliveries WHERE job_id IN ({purged}) GROUP BY status
+                ON CONFLICT (status) DO UPDATE SET messages = delivery_totals.messages + excluded.messages
+            ;
+            """, cutoff
+        )
+        db_cursor.execute(f"DELETE FROM deliveries WHERE job_id IN ({purged})", cutoff)
+        db_cursor.execute(f"DELETE FROM delivery_jobs WHERE job_id IN ({purged})", cutoff)
+        db_connection.commit()
+        return db_cursor.rowcount
+
+    def stats(self, window=60):
+        """Queue depth, throughput over the last `window` seconds and delivery latency of recent jobs"""
+        with connection(self.db_url) as db_connection:
+            db_cursor = db_connection.cursor()
+            now = time()
+            db_cursor.execute(
+                """
+                    SELECT
+                        (SELECT count(*) FROM delivery_jobs WHERE status IN ('pending', 'processing')),
+                        (SELECT count(*) FROM deliveries WHERE status = 'pending'),
+                        (SELECT count(*) FROM deliveries WHERE sent_at >= ?),
+                        (SELECT min(created_at) FROM delivery_jobs WHERE status IN ('pending', 'processing'))
+                ;
+                """, (now - window,)
+            )
+            jobs_queued, messages_queued, messages_sent, oldest_queued = db_cursor.fetchone()
+            db_cursor.execute(
+                """
+                    SELECT count(*), avg(finished_at - created_at), max(finished_at - created_at)
+                    FROM delivery_jobs
+                    WHERE status = 'done' AND finished_at >= ?
+                ;
+                """, (now - 60 * 60,)
+            )
+            jobs_done, latency_avg, latency_max = db_cursor.fetchone()
+            #  deliveries within retention plus running totals of purged ones
+            db_cursor.execute("SELECT status, count(*) FROM deliveries GROUP BY status")
+            totals = dict(db_cursor.fetchall())
+            db_cursor.execute("SELECT status, messages FROM delivery_totals")
+            for status, messages in db_cursor.fetchall():
+                totals[status] = totals.get(status, 0) + messages
+
+        return {
+            "jobs_queued": jobs_queued,
+            "messages_queued": messages_queued,
+            "oldest_queued_age": round(now - oldest_queued, 3) if oldest_queued else 0,
+            "throughput_per_second": round(messages_sent / window, 3),
+            "jobs_done_last_hour": jobs_done,
+            "latency_avg_last_hour": round(latency_avg or 0, 3),
+            "latency_max_last_hour": round(latency_max or 0, 3),
+            "messages_total": totals
+        }
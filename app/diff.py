@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import namedtuple, defaultdict
+
+
+SectionDelta = namedtuple("SectionDelta", ["new", "changed", "disappeared"])
+
+
+def fingerprint(release):
+    """Mutable part of a release card: price and stock status"""
+    return release[4], release[8]
+
+
+class DiffEngine:
+    """In-memory index of known releases per section. Loaded once, kept up to date on every insert"""
+    def __init__(self):
+        self.known = defaultdict(dict)
+        self.listed = dict()
+        self.loaded = False
+
+    def load(self, db_cursor):
+        """Load known redeye IDs of every section. No-op after the first call"""
+        if self.loaded:
+            return
+        db_cursor.execute(
+            """
+                SELECT rs.section_table, r.redeye_id, r.price, r.status
+                FROM release_sections rs
+                JOIN releases r ON r.redeye_id = rs.redeye_id
+            ;
+            """
+        )
+        for table, redeye_id, price, status in db_cursor.fetchall():
+            self.known[table][redeye_id] = (price, status)
+        self.loaded = True
+        logging.info(f"Diff engine loaded {sum(len(ids) for ids in self.known.values())} known releases")
+
+    def diff(self, table, releases):
+        """new: not seen in section before, changed: price or status differ from stored ones,
+        disappeared: listed on previous poll of section but not on this one. An empty listing is an error page
+        rather than a section that sold out at once, nothing is reported as disappeared for it"""
+        known = self.known[table]
+        new, changed, seen = list(), list(), set()
+        for release in releases:
+            redeye_id = release[0]
+            if redeye_id in seen:
+                continue
+            seen.add(redeye_id)
+            if redeye_id not in known:
+                new.append(release)
+            elif known[redeye_id] != fingerprint(release):
+                changed.append(release)
+        disappeared = sorted(self.listed[table] - seen) if table in self.listed and seen else []
+        return SectionDelta(new, changed, disappeared)
+
+    def apply(self, table, delta, releases):
+        """Remember delta once it was written to database"""
+        known = self.known[table]
+        for release in delta.new + delta.changed:
+            known[release[0]] = fingerprint(release)
+        if releases:
+            self.listed[table] = {release[0] for release in releases}
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import json
+import random
+import logging
+from time import time, monotonic, sleep
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app.audience import AudienceIndex
+from app.delivery import DeliveryQueue, release_fields
+from app.render import RenderedMessage, release_renderer
+from app.media import MediaCache, file_name
+from app.http_client import HttpClient
+from app.rate_limit import TokenBucket, KeyedTokenBuckets
+from app.telegram_client import TelegramClient, TelegramError
+from config import DISPATCHER_CONCURRENCY, DISPATCHER_MAX_ATTEMPTS, DISPATCHER_BACKOFF, DISPATCHER_BACKOFF_MAX, \
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, DIGEST_WINDOW, DIGEST_MAX_SIZE, DIGEST_MAX_JOBS, headers
+
+
+MESSAGE_LIMIT = 4096
+#  Bot API error descriptions about the uploaded file itself rather than the chat it was sent to
+MEDIA_ERRORS = (
+    "IMAGE_PROCESS_FAILED", "PHOTO_", "AUDIO_", "wrong file", "wrong type", "file is too big", "file must be non-empty",
+    "can't use file of type", "failed to get HTTP URL content", "Request Entity Too Large",
+)
+
+
+class Dispatcher:
+    """Drains delivery queue: resolves release audience and sends release to every subscriber
+    within Telegram limits (about 30 messages/sec overall, 1 message/sec per chat)"""
+    purge_interval = 60 * 60
+
+    def __init__(self, queue=None, telegram=None, concurrency=DISPATCHER_CONCURRENCY, global_rate=TELEGRAM_GLOBAL_RATE,
+                 chat_rate=TELEGRAM_CHAT_RATE, max_attempts=DISPATCHER_MAX_ATTEMPTS, backoff=DISPATCHER_BACKOFF,
+                 backoff_max=DISPATCHER_BACKOFF_MAX, digest_window=DIGEST_WINDOW, digest_max_size=DIGEST_MAX_SIZE,
+                 digest_max_jobs=DIGEST_MAX_JOBS, renderer=None, media=None):
+        self.queue = queue or DeliveryQueue()
+        self.renderer = renderer or release_renderer
+        self.media = media or MediaCache(self.queue.db_url)
+        self.concurrency = max(concurrency, 1)
+        self.telegram = telegram or TelegramClient(pool_size=self.concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="send")
+        #  covers and samples are downloaded once per file, then sent by file_id
+        self.http = HttpClient(headers=headers, pool_size=self.concurrency)
+        #  no bursts: Telegram counts messages in a sliding window, so sends are spaced evenly
+        self.global_bucket = TokenBucket(global_rate, capacity=1)
+        self.chat_buckets = KeyedTokenBuckets(chat_rate, capacity=1)
+        self.paused_until = 0
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff
+        self.backoff_max = backoff_max
+        self.digest_window = digest_window
+        self.digest_max_size = max(digest_max_size, 1)
+        self.digest_max_jobs = max(digest_max_jobs, 1)
+        self.purged_at = 0
+        self.db_connection = self.queue.connect()
+        DeliveryQueue.create_tables(self.db_connection.cursor())
+        AudienceIndex.create_table(self.db_connection.cursor())
+        MediaCache.create_table(self.db_connection.cursor())
+        self.db_connection.commit()
+        self.queue.recover(self.db_connection)
+
+    def close(self):
+        self.pool.shutdown()
+        self.telegram.close()
+        self.http.close()
+        self.db_connection.close()
+
+    def get_release(self, redeye_id, table):
+        db_cursor = self.db_connection.cursor()
+        db_cursor.execute(
+            """
+                SELECT r.title, r.cat, r.tracklist, r.price, r.release_url, r.samples, rs.genre, rs.section, r.img
+                FROM releases r
+                JOIN release_sections rs ON rs.redeye_id = r.redeye_id
+                WHERE r.redeye_id = ? AND rs.section_table = ?
+            ;
+            """, (redeye_id, table)
+        )
+        return db_cursor.fetchone()
+
+    def get_audience(self, genre):
+        """Active users subscribed to genre"""
+        return self.queue.audience(self.db_connection.cursor(), genre)
+
+    def deactivate_users(self, user_chat_ids):
+        self.db_connection.executemany(
+            "UPDATE users SET is_active = false WHERE user_chat_id = ?", [(user_chat_id,) for user_chat_id in user_chat_ids]
+        )
+        AudienceIndex.invalidate(self.db_connection.cursor())
+        self.db_connection.commit()
+
+    def pause(self, seconds):
+        """Telegram asked to slow down: nothing is sent until pause is over"""
+        self.paused_until = max(self.paused_until, monotonic() + seconds)
+        logging.warning(f"Flood control: sending paused for {seconds} seconds")
+
+    def wait_for_slot(self, user_chat_id):
+        """Respect flood control pause, global and per-chat rate limits"""
+        while monotonic() < self.paused_until:
+            sleep(self.paused_until - monotonic())
+        self.chat_buckets.consume(user_chat_id)
+        self.global_bucket.consume()
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def digest_messages(releases, max_size):
+        """Group releases of one user into digest texts of at most `max_size` releases and Telegram text limit"""
+        entries = [
+            f"*{genre.upper()}* · {section}\n{title}\n_{cat}_\n{price}\n{release_url}"
+            for title, cat, tracklist, price, release_url, samples, genre, section, img in releases
+        ]
+        chunks, chunk, length = list(), list(), 0
+        for n, entry in enumerate(entries):
+            if chunk and (len(chunk) >= max_size or length + len(entry) > MESSAGE_LIMIT - 100):
+                chunks.append(chunk)
+                chunk, length = list(), 0
+            chunk.append(n)
+            length += len(entry) + 2
+        if chunk:
+            chunks.append(chunk)
+        return [
+            (chunk, f"*{len(chunk)} new releases*\n\n" + "\n\n".join(entries[n] for n in chunk)) for chunk in chunks
+        ]
+
+    def deliver(self, user_chat_id, message):
+        """One Bot API call. Media is sent by its cached file_id, the first send of a file uploads it"""
+        if message.field is None:
+            return self.telegram.call(message.method, message.body(user_chat_id))
+        file_id = self.media.get(message.redeye_id, message.url)
+        if file_id is None:
+            with self.media.upload_lock(message.url):
+                file_id = self.media.get(message.redeye_id, message.url)
+                if file_id is None:
+                    return self.upload(user_chat_id, message)
+        return self.telegram.call(message.method, message.body(user_chat_id, file_id))
+
+    def upload(self, user_chat_id, message):
+        """Download media and send it to the chat as a file. Its file_id is kept for every later send.
+        Media that can't be downloaded or is rejected by Telegram is replaced with its fallback or skipped"""
+        if message.url not in self.media.failed:
+            result = None
+            try:
+                response = self.http.get(message.url)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                logging.warning(f"Can't download {message.url}: {e}")
+                self.media.failed.add(message.url)
+            else:
+                try:
+                    result = self.telegram.call(
+                        message.method, message.form(user_chat_id),
+                        files={message.field: (file_name(message.url), response.content)}
+                    )
+                except TelegramError as e:
+                    #  flood control and server errors are retried by send_one. Errors about the chat, such as a blocked
+                    #  bot or a deleted account, fail this delivery only and the next recipient uploads the file
+                    if not any(marker in (e.description or "") for marker in MEDIA_ERRORS):
+                        raise
+                    logging.warning(f"Telegram rejected {message.url}: {e}")
+                    self.media.failed.add(message.url)
+            if result is not None:
+                try:
+                    self.media.save(message.redeye_id, message.url, message.file_id(result))
+                except Exception as e:
+                    #  file is delivered to this chat, later sends use the fallback instead of uploading it again
+                    logging.error(f"Can't keep file_id of {message.url}: {e!r}")
+                    self.media.failed.add(message.url)
+                return result
+        if message.fallback is not None:
+            return self.deliver(user_chat_id, message.fallback)
+        return None
+
+    def send(self, user_chat_id, messages):
+        """Send rendered messages of a delivery to one chat in order. Runs in send pool threads:
+        returns (status, error, attempts) and leaves database to caller"""
+        total = 0
+        for message in messages:
+            try:
+                status, error, attempts = self.send_one(user_chat_id, message)
+            except Exception as e:
+                #  anything unexpected fails this delivery only, the rest of the batch is still recorded
+                logging.error(f"Can't send message to {user_chat_id}: {e!r}")
+                return "failed", repr(e), total + 1
+            total += attempts
+            if status != "sent":
+                return status, error, total
+        return "sent", None, total
+
+    def send_one(self, user_chat_id, message):
+        """Send one message. 429 is retried after retry_after, transient errors with backoff"""
+        attempts = 0
+        while True:
+            self.wait_for_slot(user_chat_id)
+            attempts += 1
+            try:
+                logging.debug(f"Sending message to user chat id: {user_chat_id}")
+                self.deliver(user_chat_id, message)
+                return "sent", None, attempts
+            except TelegramError as e:
+                if e.error_code == 429:
+                    self.pause(e.retry_after or 1)
+                    continue
+                transient = e.error_code >= 500
+                error = e
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                transient = True
+                error = e
+            if transient and attempts < self.max_attempts:
+                delay = self.backoff(attempts - 1)
+                logging.warning(f"Can't send message to {user_chat_id}: {error}. Retry in {delay:.1f} seconds")
+                sleep(delay)
+                continue
+            logging.warning(f"Can't send message to {user_chat_id}: {error}")
+            return "failed", str(error), attempts
+
+    def save_results(self, results):
+        """Write a batch of (job_id, user_chat_id, status, error, attempts) results in one transaction"""
+        if not results:
+            return
+        self.queue.mark_many(self.db_connection, results)
+        blocked = {
+            user_chat_id for _, user_chat_id, status, error, _ in results
+            if status == "failed" and ("bot was blocked by the user" in error or "user is deactivated" in error)
+        }
+        if blocked:
+            self.deactivate_users(blocked)
+
+    def uploads_first(self, messages):
+        """Split deliveries into the first one of every file not uploaded yet and the rest. Uploads go out
+        before the rest, so fan-out sends files by file_id instead of holding rate limit slots while waiting for them"""
+        seen = set()
+        uploads, rest = list(), list()
+        for delivery in messages:
+            upload = False
+            for message in delivery[2]:
+                key = (message.redeye_id, message.url) if message.field else None
+                if key is None or key in seen:
+                    continue
+                seen.add(key)
+                if message.url not in self.media.failed and self.media.get(*key) is None:
+                    upload = True
+            (uploads if upload else rest).append(delivery)
+        return uploads, rest
+
+    def process(self, jobs, stop=None):
+        """Send jobs to their audiences through the send pool. With more than one job, releases are
+        coalesced per user into digests. Jobs stay in processing if `stop` is set halfway, recover() resumes them"""
+        audiences = dict()
+        releases = dict()
+        keys = dict()
+        per_user = dict()
+        for job_id, redeye_id, table, payload, expanded in jobs:
+            #  jobs queued in bulk carry the release and their recipients, the rest are looked up here
+            release = tuple(json.loads(payload)) if payload else self.get_release(redeye_id, table)
+            if release is not None:
+                #  payloads queued before covers were sent have no img
+                release += (None,) * (len(release_fields) - len(release))
+            if release is None:
+                logging.warning(f"Job {job_id}: release {redeye_id} not found in {table}. Skip it")
+                self.queue.finish(self.db_connection, job_id)
+                continue
+            genre = release[6]
+            if expanded is None:
+                if genre not in audiences:
+                    audiences[genre] = self.get_audience(genre)
+                self.queue.add_recipients(self.db_connection, job_id, audiences[genre])
+            recipients = self.queue.pending_recipients(self.db_connection, job_id)
+            logging.info(f"Job {job_id}: release {redeye_id} ({genre}) to {len(recipients)} users")
+            releases[job_id] = release
+            keys[job_id] = (redeye_id, table)
+            for user_chat_id in recipients:
+                per_user.setdefault(user_chat_id, []).append(job_id)
+
+        #  (user_chat_id, job_ids, messages) of every delivery. A release is rendered once
+        #  for all its recipients, fan-out only puts chat_id in front of the serialized body
+        messages = list()
+        for user_chat_id, job_ids in per_user.items():
+            if len(job_ids) == 1:
+                messages.append((user_chat_id, job_ids, self.renderer.get(*keys[job_ids[0]], releases[job_ids[0]])))
+                continue
+            for chunk, text in self.digest_messages([releases[job_id] for job_id in job_ids], self.digest_max_size):
+                messages.append((user_chat_id, [job_ids[n] for n in chunk], [RenderedMessage(text)]))
+
+        #  messages are fed to the pool in windows, so a stop request doesn't wait for the whole audience
+        window = self.concurrency * 4
+        uploads, messages = self.uploads_first(messages)
+        batches = [uploads[n:n + window] for n in range(0, len(uploads), window)]
+        batches += [messages[n:n + window] for n in range(0, len(messages), window)]
+        for batch in batches:
+            if stop is not None and stop.is_set():
+                return
+            futures = [self.pool.submit(self.send, user_chat_id, delivery) for user_chat_id, _, delivery in batch]
+            results = list()
+            exception = None
+            for (user_chat_id, job_ids, _), future in zip(batch, futures):
+                try:
+                    status, error, attempts = future.result()
+                except Exception as e:
+                    exception = exception or e
+                    continue
+                results.extend((job_id, user_chat_id, status, error, attempts) for job_id in job_ids)
+            #  deliveries already sent are recorded before any error goes up, so they aren't sent again
+            self.save_results(results)
+            if exception is not None:
+                raise exception
+        for job_id in releases:
+            self.queue.finish(self.db_connection, job_id)
+        if len(releases) > 1:
+            logging.info(f"{len(releases)} jobs coalesced into {len(uploads) + len(messages)} messages")
+
+    def drain(self, stop=None):
+        """Process pending jobs until queue is empty or `stop` event is set. Returns number of jobs processed.
+        In digest mode jobs are held until the oldest one is `digest_window` seconds old, then sent together"""
+        processed = 0
+        if monotonic() - self.purged_at >= self.purge_interval:
+            logging.debug(f"{self.queue.purge(self.db_connection)} finished delivery jobs purged")
+            self.purged_at = monotonic()
+        #  jobs left in processing by a failed drain go back to the queue, their sent deliveries are skipped
+        self.queue.recover(self.db_connection)
+        while stop is None or not stop.is_set():
+            if self.digest_window > 0:
+                oldest = self.queue.oldest_pending(self.db_connection)
+                if oldest is None or time() - oldest < self.digest_window:
+                    break
+                jobs = self.queue.next_jobs(self.db_connection, self.digest_max_jobs)
+            else:
+                jobs = self.queue.next_jobs(self.db_connection, 1)
+            if not jobs:
+                break
+            self.process(jobs, stop=stop)
+            processed += len(jobs)
+        return processed
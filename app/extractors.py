@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import logging
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup, Comment
+
+from config import REDEYE_CDN
+
+
+RELEASE_DATA_ERRORS = (AttributeError, KeyError, IndexError, TypeError, ValueError)
+
+
+def samples_urls(redeye_id, count):
+    """Samples are stored on CDN as {redeye_id}.mp3, {redeye_id}b.mp3, {redeye_id}c.mp3, ..."""
+    if count == 0:
+        return ""
+    return f"{REDEYE_CDN}/{redeye_id}.mp3" + "".join([f",{REDEYE_CDN}/{redeye_id}{chr(i + 97)}.mp3" for i in range(1, count)])
+
+
+def parse_release_data(release):
+    """Combine releases data from web for usage"""
+    redeye_id = int(release["id"])
+    title = release.find("p", attrs={"class": "artist"}).text
+    #  label name, line break, catalogue number. Comments aren't content, a linked label name is its text
+    label = [child for child in release.find("p", attrs={"class": "label"}).contents if not isinstance(child, Comment)]
+    cat = f"{label[2].text} – {label[0].text}"
+    tracklist = release.find("p", attrs={"class": "tracks"}).text
+    samples = samples_urls(redeye_id, len(release.findAll("a", attrs={"class": "btn-play"})))
+    price = release.find("div", attrs={"class": "price"}).text.replace("\n", "").replace("!", "!\n")
+    status = release.find("div", attrs={"class": "type"}).text
+    img = release.find("img")["src"]
+    release_url = release.find("a")["href"]
+
+    return redeye_id, title, cat, tracklist, price, release_url, samples, img, status
+
+
+class SoupExtractor:
+    """Builds full BeautifulSoup tree of the page and looks every field up in it"""
+    name = "soup"
+
+    def extract(self, content):
+        soup = BeautifulSoup(content, "html.parser")
+        releases = list()
+        for release in soup.findAll("div", attrs={"class": "releaseGrid"}):
+            try:
+                releases.append(parse_release_data(release))
+            except RELEASE_DATA_ERRORS as e:
+                logging.warning(f"Can't parse release {release.get('id')}: {e!r}")
+        return releases
+
+
+class StreamingExtractor(HTMLParser):
+    """Single pass over the page: only release grid fields are collected, no tree is built"""
+    name = "streaming"
+    ascii_spaces = "\x20\x0a\x09\x0c\x0d"
+    void_tags = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+    #  field: (tag, class) of the first matching element inside release card
+    text_fields = {
+        "title": ("p", "artist"),
+        "label": ("p", "label"),
+        "tracklist": ("p", "tracks"),
+        "price": ("div", "price"),
+        "status": ("div", "type"),
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.releases = list()
+        self.release = None
+        self.div_depth = 0
+        self.captures = list()
+        self.data = list()
+
+    def extract(self, content):
+        if isinstance(content, bytes):
+            content = content.decode("utf-8", errors="replace")
+        self.reset()
+        self.releases, self.release, self.div_depth, self.captures, self.data = list(), None, 0, list(), list()
+        self.feed(content)
+        self.close()
+        return self.releases
+
+    def handle_starttag(self, tag, attrs):
+        self.flush_data()
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if self.release is None:
+            if tag == "div" and "releaseGrid" in classes:
+                self.release = {"id": attrs.get("id"), "samples": 0}
+                self.div_depth = 1
+            return
+        void = tag in self.void_tags
+        for capture in self.captures:
+            if capture["level"] == 0 and capture["field"] == "label":
+                #  direct children of label paragraph, the same way parse_release_data takes them from bs4 .contents
+                capture["children"].append([tag, ""])
+            if not void:
+                capture["level"] += 1
+        if tag == "div" and not void:
+            self.div_depth += 1
+        if tag == "a":
+            self.release.setdefault("release_url", attrs.get("href"))
+            if "btn-play" in classes:
+                self.release["samples"] += 1
+        elif tag == "img":
+            self.release.setdefault("img", attrs.get("src"))
+        for field, (field_tag, field_class) in self.text_fields.items():
+            if tag == field_tag and field_class in classes and field not in self.release and not void:
+                self.release[field] = None
+                self.captures.append({"field": field, "level": 0, "text": [], "children": []})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in self.void_tags:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self.flush_data()
+        if self.release is None or tag in self.void_tags:
+            return
+        for capture in list(self.captures):
+            if capture["level"] == 0:
+                self.captures.remove(capture)
+                self.release[capture["field"]] = capture
+            else:
+                capture["level"] -= 1
+        if tag == "div":
+            self.div_depth -= 1
+            if self.div_depth == 0:
+                self.finish_release()
+
+    def handle_data(self, data):
+        if self.release is not None:
+            self.data.append(data)
+
+    def handle_comment(self, data):
+        self.flush_data()
+
+    def flush_data(self):
+        """Text between two tags, whitespace-only strings are collapsed the same way bs4 does it"""
+        if not self.data:
+            return
+        data, self.data = "".join(self.data), list()
+        if not data.strip(self.ascii_spaces):
+            data = "\n" if "\n" in data else " "
+        for capture in self.captures:
+            capture["text"].append(data)
+            if capture["field"] == "label":
+                children = capture["children"]
+                if capture["level"] == 0 and (not children or children[-1][0] is not None):
+                    children.append([None, data])
+                else:
+                    children[-1][1] += data
+
+    def finish_release(self):
+        release, self.release, self.captures = self.release, None, list()
+        try:
+            redeye_id = int(release["id"])
+            text = {field: "".join(release[field]["text"]) for field in self.text_fields}
+            label = release["label"]["children"]
+            cat = f"{label[2][1]} – {label[0][1]}"
+            price = text["price"].replace("\n", "").replace("!", "!\n")
+            self.releases.append((
+                redeye_id, text["title"], cat, text["tracklist"], price, release["release_url"],
+                samples_urls(redeye_id, release["samples"]), release["img"], text["status"]
+            ))
+        except RELEASE_DATA_ERRORS as e:
+            logging.warning(f"Can't parse release {release.get('id')}: {e!r}")
+
+
+extractors = {
+    SoupExtractor.name: SoupExtractor,
+    StreamingExtractor.name: StreamingExtractor,
+}
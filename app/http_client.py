@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import random
+import logging
+import threading
+from time import sleep
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.rate_limit import TokenBucket
+from config import HTTP_POOL_SIZE, HTTP_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF, HTTP_BACKOFF_MAX, HTTP_HOST_RATE_LIMIT, \
+    HTTP_RETRY_BUDGET
+
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HttpClient:
+    """Long-lived pooled HTTP client with keep-alive, retries and per-host rate limiting"""
+    def __init__(self, headers=None, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES,
+                 backoff=HTTP_BACKOFF, backoff_max=HTTP_BACKOFF_MAX, host_rate_limit=HTTP_HOST_RATE_LIMIT,
+                 retry_budget=HTTP_RETRY_BUDGET):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.host_rate_limit = host_rate_limit
+        self.host_buckets = dict()
+        #  retry budget: every successful request earns a fraction of a retry, so a failing host can't multiply the load
+        self.retry_budget = retry_budget
+        self.retry_tokens = float(retry_budget)
+        self.lock = threading.Lock()
+
+    def _host_bucket(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_buckets:
+                self.host_buckets[host] = TokenBucket(self.host_rate_limit)
+            return self.host_buckets[host]
+
+    def _deposit_retry(self):
+        with self.lock:
+            self.retry_tokens = min(self.retry_budget, self.retry_tokens + 0.2)
+
+    def _withdraw_retry(self):
+        with self.lock:
+            if self.retry_tokens >= 1:
+                self.retry_tokens -= 1
+                return True
+            return False
+
+    def _delay(self, attempt, response=None):
+        """Jittered exponential backoff, Retry-After header wins if server sent it"""
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return min(int(response.headers["Retry-After"]), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        """Send request. Returns the last response or raises requests.RequestException"""
+        kwargs.setdefault("timeout", self.timeout)
+        bucket = self._host_bucket(url) if self.host_rate_limit else None
+        attempt = 0
+        while True:
+            if bucket:
+                bucket.consume()
+            error, response = None, None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if error is None and response.status_code not in RETRY_STATUS_CODES:
+                self._deposit_retry()
+                return response
+            if attempt >= self.retries or not self._withdraw_retry():
+                if error is not None:
+                    raise error
+                return response
+            delay = self._delay(attempt, response)
+            logging.warning(f"{method} {url} failed ({error or response.status_code}). Retry in {delay:.1f} seconds")
+            sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import os
+from threading import Lock
+from urllib.parse import urlsplit
+
+from app.db import connection
+from config import DB_URL
+
+
+#  Telegram file_id of every cover and sample sent before, one row per release and file URL
+create_release_files = """
+    CREATE TABLE IF NOT EXISTS release_files (
+        redeye_id INT NOT NULL,
+        url VARCHAR NOT NULL,
+        file_id VARCHAR NOT NULL,
+        PRIMARY KEY (redeye_id, url)
+) WITHOUT ROWID;
+"""
+
+
+def file_name(url):
+    return os.path.basename(urlsplit(url).path) or "file"
+
+
+class MediaCache:
+    """file_id of uploaded release media. A file is uploaded to Telegram once, by the first send,
+    every later send to any chat refers to it by file_id, so Telegram doesn't fetch it again"""
+    def __init__(self, db_url=DB_URL):
+        self.db_url = db_url
+        self.lock = Lock()
+        self.file_ids = dict()
+        self.upload_locks = dict()
+        #  URLs that couldn't be downloaded during this process' life
+        self.failed = set()
+
+    @staticmethod
+    def create_table(db_cursor):
+        db_cursor.execute(create_release_files)
+
+    def get(self, redeye_id, url):
+        """Cached file_id or None if file wasn't uploaded yet"""
+        key = (redeye_id, url)
+        with self.lock:
+            if key in self.file_ids:
+                return self.file_ids[key]
+        with connection(self.db_url) as db_connection:
+            db_cursor = db_connection.cursor()
+            db_cursor.execute("SELECT file_id FROM release_files WHERE redeye_id = ? AND url = ?", key)
+            row = db_cursor.fetchone()
+        if row is None:
+            return None
+        with self.lock:
+            self.file_ids[key] = row[0]
+        return row[0]
+
+    def save(self, redeye_id, url, file_id):
+        with connection(self.db_url) as db_connection:
+            db_connection.execute(
+                """
+                    INSERT INTO release_files (redeye_id, url, file_id) VALUES (?, ?, ?)
+                    ON CONFLICT (redeye_id, url) DO UPDATE SET file_id = excluded.file_id
+                ;
+                """, (redeye_id, url, file_id)
+            )
+            db_connection.commit()
+        with self.lock:
+            self.file_ids[(redeye_id, url)] = file_id
+
+    def upload_lock(self, url):
+        """Held while a file is uploaded, so concurrent sends wait for its file_id instead of uploading it too"""
+        with self.lock:
+            return self.upload_locks.setdefault(url, Lock())
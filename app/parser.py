@@ -4,23 +4,102 @@
 
 import re
 import json
-import sqlite3
+import hashlib
 import logging
-from time import sleep
+from time import time, perf_counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
+from collections import namedtuple
 
 import requests
 from bs4 import BeautifulSoup
 
-from config import API_HOST, DB_PATH, REDEYE_URL, REDEYE_CDN, PARSER_JSON, api_key_headers, genre_ids, headers
+from app.http_client import HttpClient
+from app.diff import DiffEngine
+from app.db import connection, table_exists, table_columns
+from app.scheduler import AdaptiveSchedule
+from app.extractors import extractors, parse_release_data
+from config import API_HOST, REDEYE_URL, PARSER_JSON, PARSER_CONCURRENCY, PARSER_EXTRACTOR, api_key_headers, genre_ids, \
+    headers
+
+
+#  IDs per IN (...) list, below SQLite's bound parameters limit
+SQL_BATCH_SIZE = 500
+
+#  diff looks at redeye_id, price and stock status only: release card opening tags carry the ids,
+#  price and type blocks carry the rest. Together they identify release grid content without parsing the page
+RELEASE_GRID_FIELDS = re.compile(
+    rb"<div[^>]*class=\"[^\"]*releaseGrid[^\"]*\"[^>]*>|<div[^>]*class=\"(?:price|type)\"[^>]*>.*?</div>", re.DOTALL
+)
+
+SectionState = namedtuple(
+    "SectionState",
+    ["etag", "last_modified", "grid_hash", "poll_interval", "next_poll_at"],
+    defaults=[None, None, None, None, None]
+)
+
+create_sections_state = """
+    CREATE TABLE IF NOT EXISTS sections_state (
+        section_table VARCHAR PRIMARY KEY,
+        etag VARCHAR,
+        last_modified VARCHAR,
+        grid_hash VARCHAR,
+        poll_interval REAL,
+        next_poll_at REAL,
+        checked_at TIMESTAMP
+);
+"""
+
+create_releases = """
+    CREATE TABLE IF NOT EXISTS releases (
+        item_id INTEGER PRIMARY KEY,
+        redeye_id INT NOT NULL,
+        title VARCHAR,
+        cat VARCHAR,
+        tracklist VARCHAR,
+        price VARCHAR,
+        release_url VARCHAR,
+        samples VARCHAR,
+        img VARCHAR,
+        status VARCHAR,
+        registered_at TIMESTAMP
+);
+"""
+
+create_release_sections = """
+    CREATE TABLE IF NOT EXISTS release_sections (
+        section_table VARCHAR NOT NULL,
+        redeye_id INT NOT NULL,
+        genre VARCHAR,
+        section VARCHAR,
+        registered_at TIMESTAMP,
+        notified_at TIMESTAMP,
+        PRIMARY KEY (section_table, redeye_id)
+);
+"""
+
+create_releases_indexes = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS releases_redeye_id ON releases (redeye_id);",
+    "CREATE INDEX IF NOT EXISTS release_sections_redeye_id ON release_sections (redeye_id, genre);",
+]
+
+
+class SectionFetchError(Exception):
+    """Section page couldn't be downloaded. Unlike an empty page it says nothing about the section's releases"""
 
 
 class Parser:
     """Parser is independent app module. Can be hosted anywhere"""
-    def __init__(self, init=False):
+    def __init__(self, init=False, extractor=PARSER_EXTRACTOR):
+        self.extractor = extractors[extractor]
+        self.schedule = AdaptiveSchedule()
+        self.diff = DiffEngine()
+        self.http = HttpClient(headers=headers, pool_size=max(PARSER_CONCURRENCY, 1))
+        #  notifications aren't idempotent: a retried POST after a timeout or 5xx would queue the releases twice
+        self.api = HttpClient(pool_size=1, retries=0, host_rate_limit=0)
+        self.bulk_api = True
         if init:
-            session = requests.Session()
-            request = session.get(REDEYE_URL, headers=headers)
+            request = self.http.get(REDEYE_URL)
             soup = BeautifulSoup(request.content, "html.parser")
             parser_json = dict()
             for g in genre_ids:
@@ -49,147 +128,384 @@ class Parser:
 
     def get_releases_from_url(self, url):
         """Get data from redeyerecords"""
-        session = requests.Session()
+        try:
+            releases, _ = self.get_section_page(url)
+        except SectionFetchError as e:
+            logging.warning(f"{e}. Skip it")
+            return []
+        return releases
+
+    def get_section_page(self, url, state=None):
+        """Conditional GET of a section page.
+        Returns (releases, state). Releases are None when page is unchanged since given state.
+        Raises SectionFetchError if page couldn't be downloaded"""
         logging.info(f"Trying to get {url}")
-        request = session.get(f"{url}", headers=headers)
+        state = state or SectionState()
+        request_headers = dict()
+        if state.etag:
+            request_headers["If-None-Match"] = state.etag
+        if state.last_modified:
+            request_headers["If-Modified-Since"] = state.last_modified
+        try:
+            request = self.http.get(url, headers=request_headers)
+        except requests.RequestException as e:
+            raise SectionFetchError(f"Can't get {url}: {e}")
+        if request.status_code == 304:
+            logging.info(f"{url} not modified")
+            return None, state
         if request.status_code == 200:
             logging.debug(f"{url} status code: {request.status_code}")
-            soup = BeautifulSoup(request.content, "html.parser")
-            releases = soup.findAll("div", attrs={"class": "releaseGrid"})
+            grid_hash = hashlib.sha1(b"".join(RELEASE_GRID_FIELDS.findall(request.content))).hexdigest()
+            new_state = state._replace(
+                etag=request.headers.get("ETag"), last_modified=request.headers.get("Last-Modified"), grid_hash=grid_hash
+            )
+            if state.grid_hash == grid_hash:
+                logging.info(f"{url} release grid unchanged")
+                return None, new_state
+            releases = self.extractor().extract(request.content)
             logging.info(f"{len(releases)} releases found at {url}")
-            return releases
+            return releases, new_state
         else:
-            logging.warning(f"{url} status code: {request.status_code}. Try again in 300 seconds.")
-            sleep(300)
-            self.get_releases_from_url(url)
+            raise SectionFetchError(f"{url} status code: {request.status_code}")
 
-    def set_db_tables(self):
-        """Create tables in database"""
-        db_connection = sqlite3.connect(DB_PATH)
-        db_cursor = db_connection.cursor()
+    @staticmethod
+    def get_sections_state(db_cursor):
+        """Load conditional request validators and poll schedule of all sections"""
+        db_cursor.execute(create_sections_state)
+        columns = table_columns(db_cursor, "sections_state")
+        for column in ("poll_interval", "next_poll_at"):
+            if column not in columns:
+                db_cursor.execute(f"ALTER TABLE sections_state ADD COLUMN {column} REAL")
+        db_cursor.execute(
+            "SELECT section_table, etag, last_modified, grid_hash, poll_interval, next_poll_at FROM sections_state"
+        )
+        return {row[0]: SectionState(*row[1:]) for row in db_cursor.fetchall()}
+
+    @staticmethod
+    def set_section_state(db_connection, db_cursor, table, state):
+        """Persist conditional request validators and poll schedule of a section"""
+        db_cursor.execute(
+            """
+                INSERT INTO sections_state
+                    (section_table, etag, last_modified, grid_hash, poll_interval, next_poll_at, checked_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (section_table) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    grid_hash = excluded.grid_hash,
+                    poll_interval = excluded.poll_interval,
+                    next_poll_at = excluded.next_poll_at,
+                    checked_at = excluded.checked_at
+            ;
+            """, (table, *state, str(datetime.now(timezone.utc)))
+        )
+        db_connection.commit()
 
+    def get_schedule(self):
+        """Current poll interval and next poll time of every section"""
+        with connection() as db_connection:
+            db_cursor = db_connection.cursor()
+            states = self.get_sections_state(db_cursor)
+        schedule = list()
         for genre in self.parser_json:
             for section in self.parser_json[genre]:
-                table = self.parser_json[genre][section]["table"]
-                db_cursor.execute(
-                    f"""
-                        DROP TABLE IF EXISTS {table}
-                    """
-                )
+                state = states.get(self.parser_json[genre][section]["table"]) or SectionState()
+                schedule.append({
+                    "genre": genre,
+                    "section": section,
+                    "table": self.parser_json[genre][section]["table"],
+                    "poll_interval": state.poll_interval or self.schedule.min_interval,
+                    "next_poll_at": state.next_poll_at
+                })
+        return schedule
+
+    def seconds_until_next_poll(self):
+        """How long daemon may sleep before the earliest section is due"""
+        next_polls = [item["next_poll_at"] or 0 for item in self.get_schedule()]
+        return max(0, min(next_polls, default=0) - time())
+
+    @staticmethod
+    def create_releases_tables(db_cursor):
+        db_cursor.execute(create_releases)
+        db_cursor.execute(create_release_sections)
+        if "notified_at" not in table_columns(db_cursor, "release_sections"):
+            #  releases stored by older versions were notified when they were registered
+            db_cursor.execute("ALTER TABLE release_sections ADD COLUMN notified_at TIMESTAMP")
+            db_cursor.execute(
+                "UPDATE release_sections SET notified_at = coalesce(registered_at, ?)", (str(datetime.now(timezone.utc)),)
+            )
+        for create_index in create_releases_indexes:
+            db_cursor.execute(create_index)
+
+    def set_db_tables(self):
+        """Create tables in database"""
+        with connection() as db_connection:
+            db_cursor = db_connection.cursor()
+
+            #  per-section tables of older versions
+            for genre in self.parser_json:
+                for section in self.parser_json[genre]:
+                    db_cursor.execute(f"DROP TABLE IF EXISTS {self.parser_json[genre][section]['table']}")
+
+            for table in ("releases", "release_sections", "sections_state"):
+                db_cursor.execute(f"DROP TABLE IF EXISTS {table}")
                 logging.info(f"Table {table} deleted")
-                db_connection.commit()
-                db_cursor.execute(
-                    f"""
-                        CREATE TABLE {table} (
-                            item_id INT,
-                            redeye_id INT,
-                            title VARCHAR,
-                            cat VARCHAR,
-                            tracklist VARCHAR,
-                            price VARCHAR,
-                            release_url VARCHAR,
-                            samples VARCHAR,
-                            img VARCHAR,
-                            genre VARCHAR,
-                            section VARCHAR,
-                            registered_at TIMESTAMP
-                    );
-                    """
-                )
-                db_connection.commit()
-                logging.info(f"New table {table} created")
-
-        db_connection.close()
+            self.create_releases_tables(db_cursor)
+            db_cursor.execute(create_sections_state)
+            db_connection.commit()
+            self.diff = DiffEngine()
+            logging.info("Tables releases, release_sections, sections_state created")
 
     @staticmethod
     def parse_release_data(release):
         """Combine releases data from web for usage"""
-        redeye_id = int(release["id"])
-        title = release.find("p", attrs={"class": "artist"}).text
-        cat = release.find("p", attrs={"class": "label"})
-        cat = f"{cat.contents[2].text} – {cat.contents[0]}"
-        tracklist = release.find("p", attrs={"class": "tracks"}).text
-        samples = release.findAll("a", attrs={"class": "btn-play"})
-        samples_str = ""
-        if len(samples) > 0:
-            samples_str = f"{REDEYE_CDN}/{redeye_id}.mp3"
-            samples_str += "".join(
-                [f",{REDEYE_CDN}/{redeye_id}{chr(i + 97)}.mp3" for i in range(1, len(samples))])
-        samples = samples_str
-        price = release.find("div", attrs={"class": "price"}).text.replace("\n", "").replace("!", "!\n")
-        status = release.find("div", attrs={"class": "type"}).text
-        img = release.find("img")["src"]
-        release_url = release.find("a")["href"]
-
-        return redeye_id, title, cat, tracklist, price, release_url, samples, img, status
+        return parse_release_data(release)
 
-    def db_initiation(self):
-        """Method that fills database with actual releases data"""
-        self.set_db_tables()
+    @staticmethod
+    def insert_releases(db_cursor, table, genre, section, releases, notified=False):
+        """Insert-or-ignore releases and their section membership. Caller commits. Memberships are stored as notified
+        if `notified` is set, otherwise caller marks the ones it notifies with mark_notified().
+        Returns (new, fresh): releases new to the section and those of them not notified in the genre yet"""
+        registered_at = str(datetime.now(timezone.utc))
+        db_cursor.executemany(
+            """
+                INSERT INTO releases
+                    (redeye_id, title, cat, tracklist, price, release_url, samples, img, status, registered_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+            ;
+            """, [(*release, registered_at) for release in releases]
+        )
+        #  genre memberships of the batch before it's added:
+        #  redeye_id -> (whether it's listed in this section already, when it was notified in the genre)
+        memberships = dict()
+        redeye_ids = [release[0] for release in releases]
+        for n in range(0, len(redeye_ids), SQL_BATCH_SIZE):
+            batch = redeye_ids[n:n + SQL_BATCH_SIZE]
+            db_cursor.execute(
+                f"""
+                    SELECT redeye_id, max(CASE WHEN section_table = ? THEN 1 ELSE 0 END), max(notified_at)
+                    FROM release_sections
+                    WHERE genre = ? AND redeye_id IN ({", ".join("?" * len(batch))})
+                    GROUP BY redeye_id
+                ;
+                """, (table, genre, *batch)
+            )
+            memberships.update((redeye_id, (listed, notified_at)) for redeye_id, listed, notified_at in db_cursor.fetchall())
+        new, fresh = list(), list()
+        for release in releases:
+            listed, notified_at = memberships.get(release[0], (0, None))
+            if listed:
+                continue
+            new.append(release)
+            if notified_at is None:
+                fresh.append(release)
+            #  a release listed twice on the page is new once
+            memberships[release[0]] = (1, notified_at)
+        db_cursor.executemany(
+            """
+                INSERT INTO release_sections (section_table, redeye_id, genre, section, registered_at, notified_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+            ;
+            """, [(table, release[0], genre, section, registered_at, registered_at if notified else None) for release in new]
+        )
+        return new, fresh
 
-        db_connection = sqlite3.connect(DB_PATH)
-        db_cursor = db_connection.cursor()
+    @staticmethod
+    def mark_notified(db_cursor, table, releases):
+        """Releases of section `table` are notified, other sections of the genre won't notify them again.
+        Caller commits"""
+        notified_at = str(datetime.now(timezone.utc))
+        db_cursor.executemany(
+            "UPDATE release_sections SET notified_at = ? WHERE section_table = ? AND redeye_id = ?",
+            [(notified_at, table, release[0]) for release in releases]
+        )
 
-        for genre in self.parser_json:
-            for section in self.parser_json[genre]:
-                table, url = self.parser_json[genre][section]["table"], self.parser_json[genre][section]["url"]
-                releases = self.get_releases_from_url(url)
-                releases.extend(self.get_releases_from_url(f"{url}/page-2")) if len(releases) == 50 else None
-                logging.info(f"Total of {len(releases)} releases parsed for {url}")
-                for release in releases:
-                    redeye_id, title, cat, tracklist, price, release_url, samples, img, status = self.parse_release_data(release)
+    def migrate_db_tables(self):
+        """Fold per-section tables of older versions into releases and release_sections"""
+        with connection() as db_connection:
+            db_cursor = db_connection.cursor()
+            self.create_releases_tables(db_cursor)
+            db_connection.commit()
+
+            for genre in self.parser_json:
+                for section in self.parser_json[genre]:
+                    table = self.parser_json[genre][section]["table"]
+                    if not table_exists(db_cursor, table):
+                        continue
                     db_cursor.execute(
                         f"""
-                            INSERT INTO {table} 
-                                (item_id, redeye_id, title, cat, tracklist, price, release_url, samples, img, genre, section, registered_at)
-                            VALUES 
-                                ((SELECT count(item_id) FROM {table}) + 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            INSERT INTO releases
+                                (redeye_id, title, cat, tracklist, price, release_url, samples, img, registered_at)
+                            SELECT redeye_id, title, cat, tracklist, price, release_url, samples, img, registered_at
+                            FROM {table}
+                            WHERE true
+                            ORDER BY registered_at, item_id
+                            ON CONFLICT DO NOTHING
                         ;
-                        """, (redeye_id, title, cat, tracklist, price, release_url, samples, img, genre, section, str(datetime.now(timezone.utc)))
+                        """
                     )
+                    db_cursor.execute(
+                        f"""
+                            INSERT INTO release_sections
+                                (section_table, redeye_id, genre, section, registered_at, notified_at)
+                            SELECT ?, redeye_id, genre, section, registered_at, registered_at
+                            FROM {table}
+                            WHERE true
+                            ORDER BY registered_at, item_id
+                            ON CONFLICT DO NOTHING
+                        ;
+                        """, (table,)
+                    )
+                    db_cursor.execute(f"DROP TABLE {table}")
                     db_connection.commit()
+                    logging.info(f"Table {table} migrated to releases / release_sections")
 
-        db_connection.close()
+    def db_initiation(self):
+        """Method that fills database with actual releases data. Returns number of rows written"""
+        self.set_db_tables()
 
-    def check_new_releases(self):
-        """Method that checks redeyerecords for new releases"""
-        logging.info(f"========== Session started at {datetime.now(timezone.utc)} ==========")
-        db_connection = sqlite3.connect(DB_PATH)
-        db_cursor = db_connection.cursor()
+        with connection() as db_connection:
+            db_cursor = db_connection.cursor()
 
-        for genre in self.parser_json:
-            for section in self.parser_json[genre]:
-                table, url = self.parser_json[genre][section]["table"], self.parser_json[genre][section]["url"]
-                db_cursor.execute(f"SELECT redeye_id FROM {table}")
-                db_redeye_ids = db_cursor.fetchall()
-                logging.debug(f"Redeye IDs in {table}: {db_redeye_ids}")
-                releases = self.get_releases_from_url(url)
-                for release in releases:
-                    redeye_id, title, cat, tracklist, price, release_url, samples, img, status = self.parse_release_data(release)
-                    if (redeye_id,) not in db_redeye_ids:
-                        db_cursor.execute(
-                            f"""
-                                INSERT INTO {table} 
-                                    (item_id, redeye_id, title, cat, tracklist, price, release_url, samples, img, genre, section, registered_at)
-                                VALUES 
-                                    ((CASE WHEN (SELECT count(item_id) FROM {table}) == 0 THEN 1 ELSE (SELECT max(item_id) FROM {table}) + 1 END), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            ;
-                            """, (redeye_id, title, cat, tracklist, price, release_url, samples, img, genre, section, str(datetime.now(timezone.utc)))
-                        )
-                        db_connection.commit()
-                        logging.info(f"New item added to DB. Redeye ID: {redeye_id}, table: {table}")
-
-                        if "sale" in url and "Out Of Stock" in status:
-                            logging.info(f"Redeye ID: {redeye_id}, table: {table} is out of stock. Ignore it")
-                            continue
-
-                        data = {
-                            "redeye_id": redeye_id,
-                            "table": self.parser_json[genre][section]["table"]
-                        }
-                        request = requests.post(f"{API_HOST}/new_release", json=data, headers=api_key_headers)
-                        if request.status_code != 200:
-                            logging.warning(f"Can't reach API! Status code: {request.status_code}")
+            rows, write_time = 0, 0
+            for genre in self.parser_json:
+                for section in self.parser_json[genre]:
+                    table, url = self.parser_json[genre][section]["table"], self.parser_json[genre][section]["url"]
+                    releases = self.get_releases_from_url(url)
+                    releases.extend(self.get_releases_from_url(f"{url}/page-2")) if len(releases) == 50 else None
+                    logging.info(f"Total of {len(releases)} releases parsed for {url}")
+                    started_at = perf_counter()
+                    new, _ = self.insert_releases(db_cursor, table, genre, section, releases, notified=True)
+                    rows += len(new)
+                    write_time += perf_counter() - started_at
+
+            #  the whole seeding is a single transaction: one fsync instead of one per release
+            started_at = perf_counter()
+            db_connection.commit()
+            write_time += perf_counter() - started_at
+        logging.info(f"{rows} rows written in {write_time:.2f} seconds ({rows / max(write_time, 1e-9):.0f} rows/sec)")
+
+        return rows
 
-        db_connection.close()
+    def check_new_releases(self, concurrency=PARSER_CONCURRENCY, stop=None, due_only=True):
+        """Method that checks redeyerecords for new releases.
+        Only sections due by adaptive schedule are polled unless `due_only` is False.
+        Sections not yet processed are abandoned as soon as `stop` event is set"""
+        logging.info(f"========== Session started at {datetime.now(timezone.utc)} ==========")
+        with connection() as db_connection:
+            db_cursor = db_connection.cursor()
+
+            states = self.get_sections_state(db_cursor)
+            self.create_releases_tables(db_cursor)
+            self.diff.load(db_cursor)
+            now = time()
+            sections = [
+                (genre, section) for genre in self.parser_json for section in self.parser_json[genre]
+                if not due_only or self.schedule.is_due(states.get(self.parser_json[genre][section]["table"]), now)
+            ]
+            logging.info(f"{len(sections)} sections are due")
+            #  pages are downloaded by a bounded pool, each one is diffed as soon as it arrives
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = dict()
+                for genre, section in sections:
+                    table, url = self.parser_json[genre][section]["table"], self.parser_json[genre][section]["url"]
+                    futures[executor.submit(self.get_section_page, url, states.get(table))] = (genre, section)
+                for future in as_completed(futures):
+                    if stop is not None and stop.is_set():
+                        logging.info("Stop requested. Remaining sections are left for next session")
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    genre, section = futures[future]
+                    try:
+                        releases, state = future.result()
+                    except Exception as e:
+                        #  failed fetch isn't "no new releases": poll interval and validators stay as they were,
+                        #  the section is retried after the shortest interval
+                        logging.warning(f"Can't get releases for {genre} / {section}: {e}. Retry it later")
+                        table = self.parser_json[genre][section]["table"]
+                        state = (states.get(table) or SectionState())._replace(next_poll_at=now + self.schedule.min_interval)
+                        self.set_section_state(db_connection, db_cursor, table, state)
+                        continue
+                    new_releases = 0
+                    if releases is not None:
+                        new_releases = len(self.process_section(db_connection, db_cursor, genre, section, releases).new)
+                    poll_interval = self.schedule.next_interval(state.poll_interval, new_releases)
+                    #  counted from session start, is_due() lets a later tick starting a bit sooner find the section due
+                    state = state._replace(poll_interval=poll_interval, next_poll_at=now + poll_interval)
+                    #  validators are saved only after the section was processed, so a crash can't hide new releases
+                    self.set_section_state(db_connection, db_cursor, self.parser_json[genre][section]["table"], state)
         logging.info(f"========== Session ended at {datetime.now(timezone.utc)} ==========")
+
+    def notify_api(self, table, genre, section, releases):
+        """Post new releases of a section to API in one request. Falls back to one request per release
+        if API has no bulk endpoint yet"""
+        if self.bulk_api:
+            data = {
+                "releases": [
+                    {
+                        "redeye_id": redeye_id, "table": table, "genre": genre, "section": section, "title": title,
+                        "cat": cat, "tracklist": tracklist, "price": price, "release_url": release_url, "samples": samples,
+                        "img": img
+                    } for redeye_id, title, cat, tracklist, price, release_url, samples, img, status in releases
+                ]
+            }
+            try:
+                request = self.api.post(f"{API_HOST}/new_releases", json=data, headers=api_key_headers)
+                if request.status_code == 200:
+                    return
+                if request.status_code not in (404, 405):
+                    logging.warning(f"Can't reach API! Status code: {request.status_code}")
+                    return
+                logging.warning("API has no bulk endpoint. Notify releases one by one")
+                self.bulk_api = False
+            except requests.RequestException as e:
+                logging.warning(f"Can't reach API! {e}")
+                return
+
+        for release in releases:
+            data = {
+                "redeye_id": release[0],
+                "table": table
+            }
+            try:
+                request = self.api.post(f"{API_HOST}/new_release", json=data, headers=api_key_headers)
+                if request.status_code != 200:
+                    logging.warning(f"Can't reach API! Status code: {request.status_code}")
+            except requests.RequestException as e:
+                logging.warning(f"Can't reach API! {e}")
+
+    def process_section(self, db_connection, db_cursor, genre, section, releases):
+        """Diff releases of one section against known ones, store the delta and notify API about new releases.
+        Returns SectionDelta"""
+        table, url = self.parser_json[genre][section]["table"], self.parser_json[genre][section]["url"]
+        if not releases and self.diff.listed.get(table):
+            logging.warning(f"{table}: no releases found on {url}, previous listing is kept")
+        delta = self.diff.diff(table, releases)
+        #  one transaction per section
+        _, fresh = self.insert_releases(db_cursor, table, genre, section, delta.new)
+        #  out of stock sale releases aren't notified here, another section of the genre may still notify them
+        notify = list()
+        for release in fresh:
+            if "sale" in url and "Out Of Stock" in release[8]:
+                logging.info(f"Redeye ID: {release[0]}, table: {table} is out of stock. Ignore it")
+                continue
+            notify.append(release)
+        self.mark_notified(db_cursor, table, notify)
+        db_cursor.executemany(
+            "UPDATE releases SET price = ?, status = ? WHERE redeye_id = ?",
+            [(price, status, redeye_id) for redeye_id, _, _, _, price, _, _, _, status in delta.changed]
+        )
+        db_connection.commit()
+        self.diff.apply(table, delta, releases)
+        logging.info(
+            f"{table}: {len(delta.new)} new, {len(delta.changed)} changed, {len(delta.disappeared)} disappeared releases"
+        )
+
+        #  notifications go out after the rows are committed, once per release and genre
+        if notify:
+            self.notify_api(table, genre, section, notify)
+
+        return delta
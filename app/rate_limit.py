@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import threading
+from time import monotonic, sleep
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`"""
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated_at = monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_consume(self, tokens=1):
+        """Take tokens if available. Returns 0 on success or seconds to wait otherwise"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def consume(self, tokens=1):
+        """Block until tokens are available"""
+        while True:
+            wait = self.try_consume(tokens)
+            if not wait:
+                return
+            sleep(wait)
+
+
+class KeyedTokenBuckets:
+    """One token bucket per key (e.g. Telegram chat). Least recently used buckets are dropped past `max_keys`"""
+    def __init__(self, rate, capacity=None, max_keys=100000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.capacity)
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            return bucket
+
+    def try_consume(self, key, tokens=1):
+        return self.get(key).try_consume(tokens)
+
+    def consume(self, key, tokens=1):
+        self.get(key).consume(tokens)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import json
+from threading import Lock
+from collections import OrderedDict
+
+from config import RENDER_CACHE_SIZE, RELEASE_COVERS, RELEASE_AUDIO, REDEYE_CDN
+
+
+CAPTION_LIMIT = 1024
+
+
+def play_label(n):
+    """PLAY A ... PLAY Z, then numbered"""
+    return f"PLAY {chr(ord('A') + n)}" if n < 26 else f"PLAY {n + 1}"
+
+
+def play_keyboard(samples):
+    """Inline keyboard with a PLAY button per sample: up to 3 in one row, more in rows of 2"""
+    buttons = [{"text": play_label(n), "url": url} for n, url in enumerate(samples)]
+    if not buttons:
+        return None
+    row_width = len(buttons) if len(buttons) <= 3 else 2
+    return {"inline_keyboard": [buttons[n:n + row_width] for n in range(0, len(buttons), row_width)]}
+
+
+def release_text(title, cat, tracklist, price, release_url, samples, genre, section, img=None):
+    return f"*{genre.upper()}*\n{section.upper()}\n\n{title}\n_{cat}_\n\n{tracklist}\n\n{price}\n{release_url}"
+
+
+class RenderedMessage:
+    """sendMessage request body serialized once. Only chat_id differs between recipients"""
+    method = "sendMessage"
+    field = None
+
+    def __init__(self, text, reply_markup=None, parse_mode="Markdown"):
+        payload = {"text": text, "parse_mode": parse_mode}
+        if reply_markup is not None:
+            payload["reply_markup"] = reply_markup
+        self.text = text
+        self.reply_markup = reply_markup
+        #  '{"text": ...}' without the opening brace, chat_id goes in front of it
+        self.tail = json.dumps(payload, ensure_ascii=False).encode("utf-8")[1:]
+
+    def body(self, chat_id):
+        return b'{"chat_id": %d, ' % chat_id + self.tail
+
+
+class MediaMessage:
+    """sendPhoto / sendAudio request. The first send uploads the file, later ones refer to its file_id
+    with the body serialized once per file_id. `fallback` is sent instead if the file can't be downloaded or uploaded"""
+    def __init__(self, method, field, redeye_id, url, caption, reply_markup=None, parse_mode="Markdown", fallback=None):
+        self.method = method
+        self.field = field
+        self.redeye_id = redeye_id
+        self.url = url
+        self.fallback = fallback
+        self.payload = {"caption": caption}
+        if parse_mode:
+            self.payload["parse_mode"] = parse_mode
+        if reply_markup is not None:
+            self.payload["reply_markup"] = reply_markup
+        self.tails = dict()
+
+    def body(self, chat_id, file_id):
+        if file_id not in self.tails:
+            self.tails[file_id] = json.dumps({self.field: file_id, **self.payload}, ensure_ascii=False).encode("utf-8")[1:]
+        return b'{"chat_id": %d, ' % chat_id + self.tails[file_id]
+
+    def form(self, chat_id):
+        """multipart/form-data fields of the uploading send, the file goes separately"""
+        form = {"chat_id": chat_id, **self.payload}
+        if "reply_markup" in form:
+            form["reply_markup"] = json.dumps(form["reply_markup"])
+        return form
+
+    def file_id(self, result):
+        """file_id of the uploaded file in sendPhoto / sendAudio result, the largest photo size for photos"""
+        media = result[self.field]
+        return media[-1]["file_id"] if isinstance(media, list) else media["file_id"]
+
+
+def release_messages(redeye_id, release, covers=RELEASE_COVERS, audio=RELEASE_AUDIO):
+    """Release text with PLAY buttons, as a cover photo caption if it fits. Samples from Redeye CDN follow as audio
+    if `audio` is on"""
+    title, cat, tracklist, price, release_url, samples, genre, section, img = release
+    text = release_text(*release)
+    samples = samples.split(",") if samples else []
+    message = RenderedMessage(text, play_keyboard(samples))
+    if covers and img and len(text) <= CAPTION_LIMIT:
+        message = MediaMessage("sendPhoto", "photo", redeye_id, img, text, play_keyboard(samples), fallback=message)
+    messages = [message]
+    if audio:
+        messages.extend(
+            MediaMessage("sendAudio", "audio", redeye_id, url, f"{title} — {play_label(n)}", parse_mode=None)
+            for n, url in enumerate(samples) if url.startswith(REDEYE_CDN)
+        )
+    return messages
+
+
+class ReleaseRenderer:
+    """LRU cache of rendered release messages keyed by redeye_id and section table, shared by fan-out and re-sends.
+    Cached messages are rendered again if the release has changed since"""
+    def __init__(self, size=RENDER_CACHE_SIZE, covers=RELEASE_COVERS, audio=RELEASE_AUDIO):
+        self.size = max(size, 1)
+        self.covers = covers
+        self.audio = audio
+        self.lock = Lock()
+        self.cache = OrderedDict()
+
+    def get(self, redeye_id, table, release):
+        key = (redeye_id, table)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] == release:
+                self.cache.move_to_end(key)
+                return cached[1]
+        messages = release_messages(redeye_id, release, self.covers, self.audio)
+        with self.lock:
+            self.cache[key] = (release, messages)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+        return messages
+
+
+release_renderer = ReleaseRenderer()
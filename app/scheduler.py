@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+from config import PARSER_MIN_INTERVAL, PARSER_MAX_INTERVAL
+
+
+class AdaptiveSchedule:
+    """Per-section poll interval: sections producing new releases are polled more often, quiet ones less"""
+    def __init__(self, min_interval=PARSER_MIN_INTERVAL, max_interval=PARSER_MAX_INTERVAL, speedup=0.5, slowdown=1.5,
+                 slack=0.1):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.speedup = speedup
+        self.slowdown = slowdown
+        #  seconds a section may be polled ahead of time: a cron tick can start sooner after its minute
+        #  than the tick which scheduled the section, without slack it would wait a whole tick more
+        self.slack = min_interval * slack
+
+    def next_interval(self, interval, new_releases):
+        """Interval after a poll which found `new_releases` new redeye IDs"""
+        interval = interval or self.min_interval
+        interval *= self.speedup if new_releases else self.slowdown
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def is_due(self, state, now):
+        return state is None or state.next_poll_at is None or state.next_poll_at <= now + self.slack
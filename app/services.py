@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import datetime, timezone
+
+from app.db import connection
+from app.audience import AudienceIndex
+from app.delivery import DeliveryQueue
+from app.stats import Statistics, statistics
+from config import genres
+
+
+#  bot handlers and API resources both call these functions in-process, HTTP API stays for external clients
+delivery_queue = DeliveryQueue()
+
+help_text = "🌐 *redeyerecords.co.uk* — dance music specialists since 1992\n\n" \
+            "*/selections* to choose selections\n\n" \
+            "*/my_subscriptions* to get a list of your subscriptions\n\n" \
+            "*/unsubscribe* to unsubscribe"
+
+
+def register_user(user_chat_id, username, first_name, last_name):
+    """Register new user or reactivate existing one with all subscriptions removed. Returns True for a new user"""
+    logging.info(f"New user! user chat id: {user_chat_id}, username: {username}")
+    with connection() as db_connection:
+        db_cursor = db_connection.cursor()
+        db_cursor.execute(
+            """
+                SELECT user_id FROM users WHERE user_chat_id = ?
+            ;
+            """, (user_chat_id,)
+        )
+        if not db_cursor.fetchone():
+            db_cursor.execute(
+                """
+                    INSERT INTO users (user_id, user_chat_id, username, first_name, last_name, is_active, registered_at)
+                    VALUES ((SELECT count(user_id) FROM users) + 1, ?, ?, ?, ?, true, ?)
+                ;
+                """, (user_chat_id, username, first_name, last_name, str(datetime.now(timezone.utc)))
+            )
+            db_connection.commit()
+            return True
+        db_cursor.execute(
+            """
+                UPDATE users
+                SET username = ?,
+                    first_name = ?,
+                    last_name = ?,
+                    is_active = true
+                WHERE user_chat_id = ?
+            ;
+            """, (username, first_name, last_name, user_chat_id)
+        )
+        db_cursor.execute(
+            """
+                DELETE FROM user_subscriptions
+                WHERE user_id = (SELECT user_id FROM users WHERE user_chat_id = ?)
+            ;
+            """, (user_chat_id,)
+        )
+        AudienceIndex.invalidate(db_cursor)
+        db_connection.commit()
+        return False
+
+
+def subscribe(user_chat_id, genre):
+    """Follow genre, a key of config.genres. Returns genre name, KeyError for unknown genre"""
+    genre_name = genres[genre]
+    with connection() as db_connection:
+        db_cursor = db_connection.cursor()
+        db_cursor.execute(
+            """
+                INSERT INTO user_subscriptions (user_id, genre)
+                SELECT user_id, ? FROM users WHERE user_chat_id = ?
+                ON CONFLICT DO NOTHING
+            ;
+            """, (genre, user_chat_id)
+        )
+        AudienceIndex.invalidate(db_cursor)
+        db_connection.commit()
+    return genre_name
+
+
+def unsubscribe(user_chat_id):
+    """Unfollow all genres"""
+    with connection() as db_connection:
+        db_cursor = db_connection.cursor()
+        db_cursor.execute(
+            """
+                DELETE FROM user_subscriptions
+                WHERE user_id = (SELECT user_id FROM users WHERE user_chat_id = ?)
+            ;
+            """, (user_chat_id,)
+        )
+        AudienceIndex.invalidate(db_cursor)
+        db_connection.commit()
+
+
+def user_subscriptions(user_chat_id):
+    """{genre name: 1 if followed else 0} for every genre"""
+    with connection() as db_connection:
+        db_cursor = db_connection.cursor()
+        db_cursor.execute(
+            """
+                SELECT genre
+                FROM user_subscriptions
+                WHERE user_id = (SELECT user_id FROM users WHERE user_chat_id = ?)
+            ;
+            """, (user_chat_id,)
+        )
+        subscriptions = {genre[0] for genre in db_cursor.fetchall()}
+    return {genres[genre]: int(genre in subscriptions) for genre in genres}
+
+
+def queue_release(redeye_id, table):
+    """Queue notification of a release found in section `table`. Returns job ID"""
+    logging.debug(f"New release - redeye_id: {redeye_id}, table: {table}")
+    return delivery_queue.enqueue(redeye_id, table)
+
+
+def queue_releases(releases):
+    """Queue notifications of a batch of releases with full payloads. Returns job IDs"""
+    logging.debug(f"New releases: {[(release['redeye_id'], release['table']) for release in releases]}")
+    return delivery_queue.enqueue_many(releases)
+
+
+def delivery_stats():
+    return delivery_queue.stats()
+
+
+def stats_message():
+    return Statistics.render(statistics.get())
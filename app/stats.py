@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+from threading import Lock
+from time import time, monotonic
+from datetime import datetime, timezone, timedelta
+
+from app.db import connection, table_exists
+from app.delivery import DeliveryQueue
+from config import DB_URL, STATS_TTL, genres
+
+
+class Statistics:
+    """Users, subscriptions, delivery and parser figures. Each table is read by one grouped scan
+    and the result is kept for `ttl` seconds, so repeated /stats calls don't touch the database"""
+    def __init__(self, db_url=DB_URL, ttl=STATS_TTL):
+        self.db_url = db_url
+        self.ttl = ttl
+        self.lock = Lock()
+        self.cached = None
+        self.cached_at = 0
+
+    def get(self):
+        with self.lock:
+            if self.cached is None or monotonic() - self.cached_at >= self.ttl:
+                self.cached = self.collect()
+                self.cached_at = monotonic()
+            return self.cached
+
+    def collect(self):
+        with connection(self.db_url) as db_connection:
+            db_cursor = db_connection.cursor()
+            stats = {
+                "users": self.users(db_cursor),
+                "subscriptions": self.subscriptions(db_cursor),
+                "parser": self.parser(db_cursor),
+            }
+        stats["delivery"] = DeliveryQueue(self.db_url).stats()
+        return stats
+
+    @staticmethod
+    def users(db_cursor):
+        db_cursor.execute("SELECT is_active, count(*) FROM users GROUP BY is_active")
+        counts = {bool(is_active): count for is_active, count in db_cursor.fetchall()}
+        return {"active": counts.get(True, 0), "total": sum(counts.values())}
+
+    @staticmethod
+    def subscriptions(db_cursor):
+        """Active and total subscribers of every genre"""
+        db_cursor.execute(
+            """
+                SELECT s.genre, sum(CASE WHEN u.is_active THEN 1 ELSE 0 END), count(*)
+                FROM user_subscriptions s
+                JOIN users u ON u.user_id = s.user_id
+                GROUP BY s.genre
+            ;
+            """
+        )
+        counts = {genre: (int(active), total) for genre, active, total in db_cursor.fetchall()}
+        return {genre: dict(zip(("active", "total"), counts.get(genre, (0, 0)))) for genre in genres}
+
+    @staticmethod
+    def parser(db_cursor):
+        """Catalogue size, releases found during the last day and poll schedule"""
+        if not table_exists(db_cursor, "releases") or not table_exists(db_cursor, "sections_state"):
+            return dict()
+        day_ago = str(datetime.now(timezone.utc) - timedelta(days=1))
+        db_cursor.execute(
+            "SELECT count(*), sum(CASE WHEN registered_at >= ? THEN 1 ELSE 0 END) FROM releases", (day_ago,)
+        )
+        releases, releases_last_day = db_cursor.fetchone()
+        db_cursor.execute(
+            """
+                SELECT count(*), max(checked_at), min(poll_interval), avg(poll_interval),
+                       sum(CASE WHEN next_poll_at <= ? THEN 1 ELSE 0 END)
+                FROM sections_state
+            ;
+            """, (time(),)
+        )
+        sections, last_check, poll_min, poll_avg, sections_due = db_cursor.fetchone()
+        return {
+            "releases": releases,
+            "releases_last_day": int(releases_last_day or 0),
+            "sections": sections,
+            "sections_due": int(sections_due or 0),
+            "last_check": str(last_check) if last_check else None,
+            "poll_interval_min": round(poll_min or 0),
+            "poll_interval_avg": round(poll_avg or 0),
+        }
+
+    @staticmethod
+    def render(stats):
+        """Markdown message for admin"""
+        text = f"*users*: active {stats['users']['active']}, total {stats['users']['total']}\n"
+        for genre, counts in stats["subscriptions"].items():
+            text += f"\n*{genre}*: active {counts['active']}, total {counts['total']}"
+        delivery = stats["delivery"]
+        text += (
+            f"\n\n*delivery*: {delivery['jobs_queued']} jobs / {delivery['messages_queued']} messages queued, "
+            f"{delivery['throughput_per_second']} msg/s, latency avg {delivery['latency_avg_last_hour']} s"
+            f" / max {delivery['latency_max_last_hour']} s"
+        )
+        parser = stats["parser"]
+        if parser:
+            text += (
+                f"\n*parser*: {parser['releases']} releases, {parser['releases_last_day']} new in 24h, "
+                f"{parser['sections_due']}/{parser['sections']} sections due, last check {parser['last_check']}"
+            )
+        return text
+
+
+statistics = Statistics()
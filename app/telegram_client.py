@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+from app.http_client import HttpClient
+from config import BOT_TOKEN, TELEGRAM_API_URL, DISPATCHER_CONCURRENCY
+
+
+class TelegramError(Exception):
+    """Unsuccessful Bot API call"""
+    def __init__(self, error_code, description, retry_after=None):
+        super().__init__(f"Error code: {error_code}. Description: {description}")
+        self.error_code = error_code
+        self.description = description
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    """Thread-safe Bot API client on a pooled keep-alive HTTP session.
+    Retries are left to the caller, so rate limiting decisions stay in one place"""
+    def __init__(self, token=BOT_TOKEN, api_url=TELEGRAM_API_URL, pool_size=DISPATCHER_CONCURRENCY):
+        self.url = f"{api_url.rstrip('/')}/bot{token}"
+        self.http = HttpClient(pool_size=max(pool_size, 1), retries=0, host_rate_limit=0)
+
+    def call(self, method, payload=None, files=None):
+        """Call Bot API method. Returns result or raises TelegramError / requests.RequestException"""
+        url = f"{self.url}/{method}"
+        if files:
+            response = self.http.post(url, data=payload, files=files)
+        elif isinstance(payload, (bytes, str)):
+            response = self.http.post(url, data=payload, headers={"Content-Type": "application/json"})
+        else:
+            response = self.http.post(url, json=payload)
+        try:
+            result = response.json()
+        except ValueError:
+            raise TelegramError(response.status_code, response.text[:200])
+        if not result.get("ok"):
+            parameters = result.get("parameters") or {}
+            raise TelegramError(
+                result.get("error_code", response.status_code), result.get("description"), parameters.get("retry_after")
+            )
+        return result["result"]
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode=None, disable_notification=None):
+        payload = {"chat_id": chat_id, "text": text}
+        if reply_markup is not None:
+            payload["reply_markup"] = reply_markup.to_dict() if hasattr(reply_markup, "to_dict") else reply_markup
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if disable_notification is not None:
+            payload["disable_notification"] = disable_notification
+        return self.call("sendMessage", payload)
+
+    def close(self):
+        self.http.close()
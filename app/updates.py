@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import logging
+from time import time, monotonic
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from telebot.types import Update
+
+from app.db import connect, connection
+from config import DB_URL, UPDATES_CONCURRENCY, UPDATES_RETENTION
+
+
+create_updates = """
+    CREATE TABLE IF NOT EXISTS updates (
+        update_id BIGINT PRIMARY KEY,
+        chat_id BIGINT,
+        body VARCHAR NOT NULL,
+        status VARCHAR NOT NULL DEFAULT 'pending',
+        error VARCHAR,
+        received_at REAL,
+        finished_at REAL
+);
+"""
+
+create_updates_indexes = [
+    "CREATE INDEX IF NOT EXISTS updates_status ON updates (status, update_id);",
+    "CREATE INDEX IF NOT EXISTS updates_chat ON updates (status, chat_id, update_id);",
+    "CREATE INDEX IF NOT EXISTS updates_finished_at ON updates (finished_at);",
+]
+
+
+def update_chat_id(update):
+    """Chat the update belongs to: chat of a message or sender of a callback query, inline query etc."""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or dict()).get("chat") or value.get("from")
+        if isinstance(chat, dict) and isinstance(chat.get("id"), int):
+            return chat["id"]
+    return None
+
+
+class UpdateQueue:
+    """Persistent queue of Telegram updates: webhook puts them and acknowledges at once, updates worker handles them.
+    update_id is the primary key, so updates redelivered by Telegram are dropped"""
+    def __init__(self, db_url=DB_URL):
+        self.db_url = db_url
+
+    def connect(self):
+        """Dedicated connection for a long running consumer such as updates worker"""
+        return connect(self.db_url)
+
+    @staticmethod
+    def create_tables(db_cursor):
+        db_cursor.execute(create_updates)
+        for create_index in create_updates_indexes:
+            db_cursor.execute(create_index)
+
+    def put(self, update, body):
+        """Queue `update`, the decoded `body` of webhook request. Returns False for an update queued before"""
+        with connection(self.db_url) as db_connection:
+            db_cursor = db_connection.cursor()
+            db_cursor.execute(
+                """
+                    INSERT INTO updates (update_id, chat_id, body, status, received_at)
+                    VALUES (?, ?, ?, 'pending', ?)
+                    ON CONFLICT DO NOTHING
+                ;
+                """, (update["update_id"], update_chat_id(update), body, time())
+            )
+            db_connection.commit()
+            return db_cursor.rowcount > 0
+
+    @staticmethod
+    def recover(db_connection):
+        """Updates left in processing by a stopped worker are handled again"""
+        db_connection.execute("UPDATE updates SET status = 'pending' WHERE status = 'processing'")
+        db_connection.commit()
+
+    @staticmethod
+    def pending(db_connection, limit):
+        """Oldest pending update of every chat as [(update_id, chat_id, body)], oldest first.
+        One row per chat, so a chat with a long backlog doesn't hide the others"""
+        db_cursor = db_connection.cursor()
+        db_cursor.execute(
+            """
+                SELECT update_id, chat_id, body
+                FROM updates
+                WHERE update_id IN (
+                    SELECT min(update_id) FROM updates WHERE status = 'pending' AND chat_id IS NOT NULL GROUP BY chat_id
+                ) OR (status = 'pending' AND chat_id IS NULL)
+                ORDER BY update_id
+                LIMIT ?
+            ;
+            """, (limit,)
+        )
+        return db_cursor.fetchall()
+
+    @staticmethod
+    def start(db_connection, update_ids):
+        db_connection.executemany(
+            "UPDATE updates SET status = 'processing' WHERE update_id = ?", [(update_id,) for update_id in update_ids]
+        )
+        db_connection.commit()
+
+    @staticmethod
+    def mark_many(db_connection, results):
+        """Record a batch of (update_id, status, error) results in one transaction"""
+        now = time()
+        db_connection.executemany(
+            "UPDATE updates SET status = ?, error = ?, finished_at = ? WHERE update_id = ?",
+            [(status, error, now, update_id) for update_id, status, error in results]
+        )
+        db_connection.commit()
+
+    @staticmethod
+    def purge(db_connection, retention=UPDATES_RETENTION):
+        """Forget handled updates older than `retention` seconds, Telegram doesn't redeliver them that late"""
+        db_cursor = db_connection.cursor()
+        db_cursor.execute("DELETE FROM updates WHERE finished_at < ?", (time() - retention,))
+        db_connection.commit()
+        return db_cursor.rowcount
+
+
+class UpdateProcessor:
+    """Handles queued updates with bot handlers in a thread pool. Updates of one chat are handled
+    one at a time in update_id order, different chats are handled concurrently"""
+    purge_interval = 60 * 60
+
+    def __init__(self, bot, queue=None, concurrency=UPDATES_CONCURRENCY):
+        self.bot = bot
+        self.queue = queue or UpdateQueue()
+        self.concurrency = max(concurrency, 1)
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="update")
+        #  future -> (update_id, chat) of updates being handled
+        self.running = dict()
+        self.purged_at = 0
+        self.db_connection = self.queue.connect()
+        UpdateQueue.create_tables(self.db_connection.cursor())
+        self.queue.recover(self.db_connection)
+
+    def close(self):
+        self.pool.shutdown()
+        self.collect()
+        self.db_connection.close()
+
+    def handle(self, update_id, body):
+        try:
+            self.bot.process_new_updates([Update.de_json(body)])
+            return "done", None
+        except Exception as e:
+            logging.error(f"Update {update_id} failed: {e!r}")
+            return "failed", repr(e)
+
+    def submit(self):
+        """Start oldest pending updates of chats that have nothing running"""
+        busy = {chat for _, chat in self.running.values()}
+        started = list()
+        #  busy chats take at most one row each, the rest is enough to fill every free worker
+        for update_id, chat_id, body in self.queue.pending(self.db_connection, self.concurrency + len(busy)):
+            #  updates without a chat have no order to keep
+            chat = chat_id if chat_id is not None else f"update {update_id}"
+            if chat in busy:
+                continue
+            busy.add(chat)
+            started.append((update_id, chat, body))
+            if len(self.running) + len(started) >= self.concurrency:
+                break
+        if not started:
+            return
+        self.queue.start(self.db_connection, [update_id for update_id, _, _ in started])
+        for update_id, chat, body in started:
+            self.running[self.pool.submit(self.handle, update_id, body)] = (update_id, chat)
+
+    def collect(self):
+        """Record handled updates, their chats are free for the next ones"""
+        results = list()
+        for future in [future for future in self.running if future.done()]:
+            update_id, _ = self.running.pop(future)
+            results.append((update_id, *future.result()))
+        if results:
+            self.queue.mark_many(self.db_connection, results)
+
+    def poll(self, stop, interval):
+        """Start what can be started, then wait for a running update to finish or `interval` seconds"""
+        if monotonic() - self.purged_at >= self.purge_interval:
+            logging.debug(f"{self.queue.purge(self.db_connection)} handled updates purged")
+            self.purged_at = monotonic()
+        if len(self.running) < self.concurrency:
+            self.submit()
+        if self.running:
+            wait(list(self.running), timeout=interval, return_when=FIRST_COMPLETED)
+        else:
+            stop.wait(interval)
+        self.collect()
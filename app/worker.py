@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import os
+import fcntl
+import logging
+from logging.handlers import TimedRotatingFileHandler
+
+from config import basedir
+
+
+def acquire_lock(name):
+    """Exclusive lock on `name`.lock in base directory, held while the returned file stays open.
+    None if another process holds it"""
+    lock_file = open(os.path.join(basedir, f"{name}.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+
+def setup_logging(name):
+    """Log everything to `name`.log in base directory, rotated at midnight"""
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+    handler = TimedRotatingFileHandler(os.path.join(basedir, f"{name}.log"), when="midnight", backupCount=10)
+    handler.setFormatter(logging.Formatter(fmt="%(asctime)s %(levelname)s %(message)s"))
+    logger.addHandler(handler)
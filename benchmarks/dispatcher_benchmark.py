@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#  config requires bot settings on import, benchmark runs without .env
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("ADMIN_CHAT_ID", "1")
+
+from database_setup import create_users, create_subscriptions_tables  # noqa: E402
+from app.db import connect  # noqa: E402
+from app.parser import Parser  # noqa: E402
+from app.delivery import DeliveryQueue  # noqa: E402
+from app.dispatcher import Dispatcher  # noqa: E402
+from app.render import ReleaseRenderer  # noqa: E402
+from app.telegram_client import TelegramClient  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegram  # noqa: E402
+
+
+GENRE = "HOUSE / DISCO"
+
+
+def setup_db(db_url, users):
+    db_connection = connect(db_url)
+    db_cursor = db_connection.cursor()
+    db_cursor.execute(create_users)
+    create_subscriptions_tables(db_cursor)
+    Parser.create_releases_tables(db_cursor)
+    DeliveryQueue.create_tables(db_cursor)
+    db_cursor.executemany(
+        "INSERT INTO users (user_id, user_chat_id, username, is_active) VALUES (?, ?, ?, true)",
+        [(n, 1000 + n, f"user{n}") for n in range(1, users + 1)]
+    )
+    db_cursor.executemany(
+        "INSERT INTO user_subscriptions (user_id, genre) VALUES (?, 'house_disco')",
+        [(n,) for n in range(1, users + 1)]
+    )
+    db_cursor.execute(
+        """
+            INSERT INTO releases (redeye_id, title, cat, tracklist, price, release_url, samples, img, status)
+            VALUES (1, 'Artist - Title', 'CAT001 – Label', 'A1 Track', '£9.99', 'https://example.com/1',
+                    'https://example.com/1.mp3,https://example.com/1b.mp3', 'https://example.com/1.jpg', '12"')
+        ;
+        """
+    )
+    db_cursor.execute(
+        "INSERT INTO release_sections (section_table, redeye_id, genre, section) VALUES ('house_new', 1, ?, 'New Releases')",
+        (GENRE,)
+    )
+    db_connection.commit()
+    db_connection.close()
+
+
+def run(users, concurrency, latency, global_rate, covers):
+    fake = FakeTelegram(latency=latency, global_rate=global_rate).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = DeliveryQueue(os.path.join(tmp, "benchmark.db"))
+        setup_db(queue.db_url, users)
+        #  cover is downloaded from fake Telegram itself, uploaded by the first send and sent by file_id after
+        db_connection = connect(queue.db_url)
+        db_connection.execute("UPDATE releases SET img = ?", (f"{fake.url}/cover.jpg",))
+        db_connection.commit()
+        db_connection.close()
+        queue.enqueue(1, "house_new")
+        dispatcher = Dispatcher(
+            queue=queue, telegram=TelegramClient(token="0:benchmark", api_url=fake.url, pool_size=concurrency),
+            concurrency=concurrency, global_rate=global_rate, renderer=ReleaseRenderer(covers=covers)
+        )
+        started_at = perf_counter()
+        dispatcher.drain()
+        elapsed = perf_counter() - started_at
+        dispatcher.close()
+    fake.stop()
+    sent = len([call for call in fake.calls if call[0] in ("sendMessage", "sendPhoto")])
+    print(
+        f"concurrency {concurrency:>3}: {sent} messages in {elapsed:.2f} s, "
+        f"{sent / elapsed:.1f} msg/s, {fake.throttled} throttled (429)"
+    )
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Dispatcher throughput against fake Telegram Bot API")
+    arg_parser.add_argument("--users", type=int, default=300)
+    arg_parser.add_argument("--latency", type=float, default=0.1, help="simulated Bot API round-trip, seconds")
+    arg_parser.add_argument("--global-rate", type=int, default=30, help="messages/sec allowed by fake Telegram")
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    arg_parser.add_argument("--no-covers", action="store_true", help="send text messages instead of cover photos")
+    args = arg_parser.parse_args()
+
+    for c in args.concurrency:
+        run(args.users, c, args.latency, args.global_rate, not args.no_covers)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#  config requires bot settings on import, benchmark runs without .env
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("ADMIN_CHAT_ID", "1")
+
+from app.extractors import extractors  # noqa: E402
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "*.html")
+
+
+def main(paths, repeat=20):
+    """Prints parsing time of every page with every extractor. Returns False if any extractor's output differs"""
+    same = True
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        results = {name: extractor().extract(content) for name, extractor in extractors.items()}
+        reference = results["soup"]
+        print(f"{os.path.basename(path)}: {len(reference)} releases")
+        for name, extractor in extractors.items():
+            if results[name] != reference:
+                print(f"  {name}: output differs from soup extractor!")
+                same = False
+            seconds = min(timeit.repeat(lambda: extractor().extract(content), number=1, repeat=repeat))
+            print(f"  {name:>10}: {seconds * 1000:.2f} ms/page")
+    return same
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Section page parsing time and output of every extractor")
+    arg_parser.add_argument("pages", nargs="*", help="saved section pages, fixtures by default")
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    sys.exit(0 if main(args.pages or sorted(glob.glob(FIXTURES)), args.repeat) else 1)
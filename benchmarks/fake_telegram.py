@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import re
+import json
+import argparse
+import threading
+from time import sleep, monotonic
+from collections import defaultdict, deque
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    """Local stand-in for Telegram Bot API: answers every method, adds latency and enforces flood control
+    (`global_rate` messages/sec overall, `chat_rate` per chat) the way Telegram does, with 429 and retry_after"""
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.05, global_rate=30, chat_rate=1):
+        super().__init__(address, FakeTelegramHandler)
+        self.latency = latency
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.lock = threading.Lock()
+        self.global_calls = deque()
+        self.chat_calls = defaultdict(deque)
+        self.blocked = set()
+        self.calls = list()
+        self.throttled = 0
+        self.file_ids = 0
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def flood_control(self, chat_id):
+        """Sliding one second window. Returns retry_after or 0"""
+        now = monotonic()
+        with self.lock:
+            chat_calls = self.chat_calls[chat_id]
+            for calls in (self.global_calls, chat_calls):
+                while calls and calls[0] <= now - 1:
+                    calls.popleft()
+            if len(self.global_calls) >= self.global_rate or len(chat_calls) >= self.chat_rate:
+                self.throttled += 1
+                return 1
+            self.global_calls.append(now)
+            chat_calls.append(now)
+            return 0
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def params(self):
+        url = urlsplit(self.path)
+        params = {key: value[0] for key, value in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        content_type = self.headers.get("Content-Type", "")
+        if body and "application/json" in content_type:
+            params.update(json.loads(body))
+        elif body and "multipart/form-data" in content_type:
+            boundary = content_type.split("boundary=", 1)[1].strip('"').encode("utf-8")
+            for part in body.split(b"--" + boundary):
+                part_headers, _, value = part.partition(b"\r\n\r\n")
+                name = re.search(rb'name="([^"]+)"', part_headers)
+                if name is None:
+                    continue
+                #  uploaded files are only recorded by size
+                params[name.group(1).decode("utf-8")] = (
+                    len(value) if b"filename=" in part_headers else value[:-2].decode("utf-8", errors="replace")
+                )
+        elif body:
+            params.update({key: value[0] for key, value in parse_qs(body.decode("utf-8")).items()})
+        return url.path.rsplit("/", 1)[-1], params
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        server = self.server
+        method, params = self.params()
+        sleep(server.latency)
+        chat_id = int(params.get("chat_id") or 0)
+        if chat_id in server.blocked:
+            return self.reply(403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})
+        if method.startswith("send"):
+            retry_after = server.flood_control(chat_id)
+            if retry_after:
+                return self.reply(429, {
+                    "ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after}
+                })
+        with server.lock:
+            server.calls.append((method, params))
+            message_id = len(server.calls)
+            server.file_ids += 1
+            file_id = f"file-{server.file_ids}"
+        result = {"message_id": message_id, "date": 0, "chat": {"id": chat_id, "type": "private"}}
+        if method == "sendPhoto":
+            result["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}]
+        elif method == "sendAudio":
+            result["audio"] = {"file_id": file_id, "file_unique_id": file_id, "duration": 0}
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        elif "text" in params:
+            result["text"] = params["text"]
+        self.reply(200, {"ok": True, "result": result})
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    arg_parser.add_argument("--port", type=int, default=8081)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every call")
+    arg_parser.add_argument("--global-rate", type=int, default=30)
+    arg_parser.add_argument("--chat-rate", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    fake = FakeTelegram(("127.0.0.1", args.port), args.latency, args.global_rate, args.chat_rate)
+    print(f"Fake Telegram Bot API on {fake.url}. Use TELEGRAM_API_URL={fake.url}")
+    fake.serve_forever()
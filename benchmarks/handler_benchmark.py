@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+from time import sleep, perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+#  bot modules read DB_URL on import, benchmark database is set up before they are imported
+TMP = tempfile.TemporaryDirectory()
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(TMP.name, 'benchmark.db')}"
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("ADMIN_CHAT_ID", "1")
+
+import database_setup  # noqa: E402
+import telebot.apihelper  # noqa: E402
+from telebot.types import Update  # noqa: E402
+from app.bot import app, bot  # noqa: E402
+from config import BOT_TOKEN, ADMIN_CHAT_ID  # noqa: E402
+
+
+class BotApiResponse:
+    """Successful Bot API reply, all handlers need from it"""
+    status_code = 200
+
+    def __init__(self, method, chat_id):
+        self.method = method
+        self.chat_id = chat_id
+
+    def json(self):
+        if self.method == "answerCallbackQuery":
+            return {"ok": True, "result": True}
+        return {"ok": True, "result": {"message_id": 1, "date": 0, "chat": {"id": self.chat_id, "type": "private"}}}
+
+    @property
+    def text(self):
+        return json.dumps(self.json())
+
+
+def bot_api(latency, calls):
+    """In-process stand-in for Bot API transport, so handler's own work is measured rather than local HTTP"""
+    def send(http_method, url, params=None, **kwargs):
+        calls.append((url.rsplit("/", 1)[-1], params))
+        if latency:
+            sleep(latency)
+        return BotApiResponse(url.rsplit("/", 1)[-1], int((params or dict()).get("chat_id") or 0))
+    return send
+
+
+def message(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Benchmark", "username": "benchmark"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+def callback(update_id, chat_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": "benchmark", "data": data,
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Benchmark"},
+        },
+    }
+
+
+#  update of every handler, in the order a user would send them
+scenario = [
+    ("/start", lambda n, chat_id: message(n, chat_id, "/start")),
+    ("/selections", lambda n, chat_id: message(n, chat_id, "/selections")),
+    ("subscribe", lambda n, chat_id: callback(n, chat_id, "house_disco")),
+    ("/my_subscriptions", lambda n, chat_id: message(n, chat_id, "/my_subscriptions")),
+    ("/help", lambda n, chat_id: message(n, chat_id, "/help")),
+    ("/stats", lambda n, chat_id: message(n, ADMIN_CHAT_ID, "/stats")),
+    ("/unsubscribe", lambda n, chat_id: message(n, chat_id, "/unsubscribe")),
+]
+
+
+def main(users, latency):
+    """Prints latency of webhook acknowledgement and every handler. Returns their p95 in seconds by name"""
+    database_setup.main()
+    calls = list()
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = bot_api(latency, calls)
+    client = app.test_client()
+    timings = {name: list() for name, _ in scenario}
+    webhook = list()
+    update_id = 0
+    for chat_id in range(1000, 1000 + users):
+        for name, make_update in scenario:
+            update_id += 1
+            body = json.dumps(make_update(update_id, chat_id))
+            started_at = perf_counter()
+            client.post("/" + BOT_TOKEN, data=body)
+            webhook.append(perf_counter() - started_at)
+            started_at = perf_counter()
+            bot.process_new_updates([Update.de_json(body)])
+            timings[name].append(perf_counter() - started_at)
+    print(f"{users} users, {len(calls)} Bot API calls, {latency * 1000:.0f} ms simulated Bot API latency")
+    p95 = dict()
+    for name, seconds in {"webhook ack": webhook, **timings}.items():
+        seconds.sort()
+        p95[name] = seconds[int(len(seconds) * 0.95)]
+        print(
+            f"{name:>18}: {sum(seconds) / len(seconds) * 1000:.2f} ms avg, "
+            f"{seconds[len(seconds) // 2] * 1000:.2f} ms p50, {p95[name] * 1000:.2f} ms p95"
+        )
+    return p95
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Per-update handler latency with in-process Bot API stand-in")
+    arg_parser.add_argument("--users", type=int, default=200)
+    arg_parser.add_argument("--latency", type=float, default=0, help="simulated Bot API round-trip, seconds")
+    arg_parser.add_argument(
+        "--max-ms", type=float, default=None, help="per-handler p95 budget, milliseconds: exit with status 1 if exceeded"
+    )
+    args = arg_parser.parse_args()
+
+    p95 = main(args.users, args.latency)
+    if args.max_ms is not None:
+        over = {name: seconds * 1000 for name, seconds in p95.items() if seconds * 1000 > args.max_ms}
+        for name, ms in over.items():
+            print(f"{name} p95 {ms:.2f} ms is over {args.max_ms:g} ms budget")
+        sys.exit(1 if over else 0)
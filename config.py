@@ -15,11 +15,48 @@ API_KEY = os.getenv("API_KEY")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_CHAT_ID = int(os.getenv("ADMIN_CHAT_ID"))
 DB_PATH = os.path.join(basedir, "app", "db", "database.db")
+DB_URL = os.getenv("DB_URL", f"sqlite:///{DB_PATH}")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", 30))
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", 16 * 1024))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 64 * 1024 * 1024))
+DB_CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", 256))
 REDEYE_URL = "https://www.redeyerecords.co.uk"
 REDEYE_CDN = "https://sounds.redeyerecords.co.uk"
 PARSER_JSON = os.path.join(basedir, "parser.json")
 APP_HOST = "https://redeyerecordsbot.ru/"
 API_HOST = APP_HOST + "api/v1"
+PARSER_MIN_INTERVAL = int(os.getenv("PARSER_MIN_INTERVAL", 300))
+PARSER_MAX_INTERVAL = int(os.getenv("PARSER_MAX_INTERVAL", 6 * 60 * 60))
+PARSER_CONCURRENCY = int(os.getenv("PARSER_CONCURRENCY", 8))
+PARSER_EXTRACTOR = os.getenv("PARSER_EXTRACTOR", "soup")
+DISPATCHER_POLL_INTERVAL = float(os.getenv("DISPATCHER_POLL_INTERVAL", 1))
+DISPATCHER_CONCURRENCY = int(os.getenv("DISPATCHER_CONCURRENCY", 8))
+DISPATCHER_MAX_ATTEMPTS = int(os.getenv("DISPATCHER_MAX_ATTEMPTS", 5))
+DISPATCHER_BACKOFF = float(os.getenv("DISPATCHER_BACKOFF", 1))
+DISPATCHER_BACKOFF_MAX = float(os.getenv("DISPATCHER_BACKOFF_MAX", 60))
+DELIVERY_RETENTION = float(os.getenv("DELIVERY_RETENTION", 7 * 24 * 60 * 60))
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", 0))
+DIGEST_MAX_SIZE = int(os.getenv("DIGEST_MAX_SIZE", 10))
+DIGEST_MAX_JOBS = int(os.getenv("DIGEST_MAX_JOBS", 200))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+STATS_TTL = float(os.getenv("STATS_TTL", 30))
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", 1024))
+RELEASE_COVERS = bool(int(os.getenv("RELEASE_COVERS", 1)))
+RELEASE_AUDIO = bool(int(os.getenv("RELEASE_AUDIO", 0)))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+UPDATES_POLL_INTERVAL = float(os.getenv("UPDATES_POLL_INTERVAL", 0.2))
+UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY", 8))
+UPDATES_RETENTION = float(os.getenv("UPDATES_RETENTION", 24 * 60 * 60))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 4))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 1))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 60))
+HTTP_HOST_RATE_LIMIT = float(os.getenv("HTTP_HOST_RATE_LIMIT", 10))
+HTTP_RETRY_BUDGET = int(os.getenv("HTTP_RETRY_BUDGET", 10))
 
 api_key_headers = {"x-api-key": API_KEY}
 
@@ -4,6 +4,7 @@
 
 import os
 import logging
+from time import perf_counter
 
 from config import basedir
 from app.parser import Parser
@@ -17,5 +18,8 @@ if __name__ == "__main__":
         format="[%(filename)s] %(asctime)s %(levelname)s %(message)s"
     )
 
+    started_at = perf_counter()
     parser = Parser(init=True)
-    parser.db_initiation()
+    rows = parser.db_initiation()
+    elapsed = perf_counter() - started_at
+    logging.info(f"Database initiated: {rows} releases in {elapsed:.2f} seconds ({rows / elapsed:.0f} rows/sec overall)")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+
+from os import path
+
+from config import PARSER_JSON, basedir, genres
+from app.db import connection, table_exists, table_columns
+from app.audience import AudienceIndex
+from app.parser import Parser
+from database_setup import create_subscriptions_tables
+
+
+def migrate_subscriptions(db_connection):
+    """Move per-genre boolean columns of legacy subscriptions table to user_subscriptions rows"""
+    db_cursor = db_connection.cursor()
+    if not table_exists(db_cursor, "subscriptions"):
+        return
+    create_subscriptions_tables(db_cursor)
+    columns = [column for column in table_columns(db_cursor, "subscriptions") if column in genres]
+    for genre in columns:
+        db_cursor.execute(
+            f"""
+                INSERT INTO user_subscriptions (user_id, genre)
+                SELECT user_id, ? FROM subscriptions WHERE {genre} = true
+                ON CONFLICT DO NOTHING
+            ;
+            """, (genre,)
+        )
+    db_cursor.execute("DROP TABLE subscriptions")
+    AudienceIndex.create_table(db_cursor)
+    AudienceIndex.invalidate(db_cursor)
+    db_connection.commit()
+    db_cursor.execute("SELECT count(*) FROM user_subscriptions")
+    logging.info(f"Subscriptions migrated: {db_cursor.fetchone()[0]} rows in user_subscriptions")
+
+
+def main():
+    with connection() as db_connection:
+        if not table_exists(db_connection.cursor(), "users"):
+            logging.info("Database isn't initiated yet. Nothing to migrate")
+            return
+        migrate_subscriptions(db_connection)
+    if not path.isfile(PARSER_JSON):
+        logging.info("Parser isn't initiated yet. Releases are not migrated")
+        return
+    parser = Parser()
+    parser.migrate_db_tables()
+    logging.info("Database migrated")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG,
+        # filename=os.path.join(basedir, "database_migration.log"),
+        # filemode="a",
+        format="[%(filename)s] %(asctime)s %(levelname)s %(message)s"
+    )
+
+    main()
@@ -5,23 +5,35 @@
 import os
 import logging
 
-import sqlite3
-from os import path
-
-from config import DB_PATH, genres, basedir
+from config import basedir
+from app.db import connection, table_exists
+from app.audience import AudienceIndex
+from app.delivery import DeliveryQueue
+from app.updates import UpdateQueue
+from app.media import MediaCache
 
 
 def main():
-    if not path.isfile(DB_PATH):
-        db_connection = sqlite3.connect(DB_PATH)
+    with connection() as db_connection:
         db_cursor = db_connection.cursor()
-        db_cursor.execute(create_users)
-        db_cursor.execute(create_subscriptions)
+        if not table_exists(db_cursor, "users"):
+            db_cursor.execute(create_users)
+            db_connection.commit()
+            logging.info("Database created")
+        else:
+            logging.info("Database already exists")
+        create_subscriptions_tables(db_cursor)
+        DeliveryQueue.create_tables(db_cursor)
+        UpdateQueue.create_tables(db_cursor)
+        AudienceIndex.create_table(db_cursor)
+        MediaCache.create_table(db_cursor)
         db_connection.commit()
-        db_connection.close()
-        logging.info("Database created")
-    else:
-        logging.info("Database already exists")
+    logging.info("Subscriptions, delivery and updates queues, cache and media tables are in place")
+
+
+def create_subscriptions_tables(db_cursor):
+    db_cursor.execute(create_user_subscriptions)
+    db_cursor.execute(create_user_subscriptions_index)
 
 
 create_users = """
@@ -36,7 +48,16 @@ create_users = """
 );
 """
 
-create_subscriptions = f"CREATE TABLE subscriptions (user_id INT PRIMARY KEY, {', '.join([genre + ' BOOLEAN' for genre in genres])});"
+#  one row per user and followed genre, genre is a key of config.genres
+create_user_subscriptions = """
+    CREATE TABLE IF NOT EXISTS user_subscriptions (
+        user_id INT NOT NULL,
+        genre VARCHAR NOT NULL,
+        PRIMARY KEY (user_id, genre)
+) WITHOUT ROWID;
+"""
+
+create_user_subscriptions_index = "CREATE INDEX IF NOT EXISTS user_subscriptions_genre ON user_subscriptions (genre, user_id);"
 
 
 if __name__ == "__main__":
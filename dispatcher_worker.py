@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+import sys
+import json
+import signal
+import logging
+import argparse
+import threading
+
+from config import DISPATCHER_POLL_INTERVAL
+from app.delivery import DeliveryQueue
+from app.dispatcher import Dispatcher
+from app.worker import acquire_lock, setup_logging
+
+
+def daemon(d, interval):
+    """Resident dispatcher: polls delivery queue, graceful SIGTERM"""
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logging.info(f"Signal {signum} received. Stopping dispatcher")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logging.info("Dispatcher started")
+    while not stop.is_set():
+        try:
+            d.drain(stop)
+        except Exception as e:
+            logging.critical(e)
+        stop.wait(interval)
+    d.close()
+    logging.info("Dispatcher stopped")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Redeye Records notifications dispatcher")
+    arg_parser.add_argument("--interval", type=float, default=DISPATCHER_POLL_INTERVAL, help="seconds between queue polls")
+    arg_parser.add_argument("--stats", action="store_true", help="print delivery queue stats and exit")
+    args = arg_parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(DeliveryQueue().stats(), indent=4))
+        sys.exit(0)
+
+    setup_logging("dispatcher_worker")
+
+    #  only one dispatcher drains the queue
+    lock = acquire_lock("dispatcher_worker")
+    if lock is None:
+        logging.warning("Another dispatcher is running. Exit")
+        sys.exit(0)
+
+    daemon(Dispatcher(), args.interval)
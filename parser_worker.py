@@ -1,27 +1,65 @@
 #!/usr/bin/python
 
-import os
+import sys
+import json
+import signal
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import argparse
+import threading
 
-from config import basedir
 from app.parser import Parser
+from app.worker import acquire_lock, setup_logging
 
 
-def main(p):
+def main(p, stop=None):
     try:
-        p.check_new_releases()
+        p.check_new_releases(stop=stop)
     except Exception as e:
         logging.critical(e)
 
 
+def daemon(p):
+    """Resident parser: warm HTTP connections, adaptive per-section scheduler, graceful SIGTERM"""
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logging.info(f"Signal {signum} received. Stopping parser daemon")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logging.info("Parser daemon started")
+    while not stop.is_set():
+        main(p, stop)
+        delay = max(1, p.seconds_until_next_poll())
+        logging.info(f"Next section is due in {delay:.0f} seconds")
+        stop.wait(delay)
+    p.http.close()
+    p.api.close()
+    logging.info("Parser daemon stopped")
+
+
 if __name__ == "__main__":
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    handler = TimedRotatingFileHandler(os.path.join(basedir, "parser_worker.log"), when="midnight", backupCount=10)
-    formatter = logging.Formatter(fmt="%(asctime)s %(levelname)s %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    arg_parser = argparse.ArgumentParser(description="Redeye Records parser worker")
+    arg_parser.add_argument("--daemon", action="store_true", help="keep running and poll sections when they are due")
+    arg_parser.add_argument("--schedule", action="store_true", help="print current poll schedule and exit")
+    args = arg_parser.parse_args()
+
+    if args.schedule:
+        print(json.dumps(Parser().get_schedule(), indent=4, ensure_ascii=False))
+        sys.exit(0)
+
+    setup_logging("parser_worker")
+
+    #  only one parser run at a time: cron tick or daemon, whatever comes first
+    lock = acquire_lock("parser_worker")
+    if lock is None:
+        logging.warning("Another parser worker is running. Exit")
+        sys.exit(0)
 
     parser = Parser()
-    main(parser)
+    if args.daemon:
+        daemon(parser)
+    else:
+        main(parser)
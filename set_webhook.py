@@ -6,7 +6,7 @@ import os
 import logging
 
 from app.bot import bot
-from config import basedir, APP_HOST, BOT_TOKEN
+from config import basedir, APP_HOST, BOT_TOKEN, WEBHOOK_SECRET
 
 
 if __name__ == "__main__":
@@ -18,5 +18,5 @@ if __name__ == "__main__":
     )
 
     bot.remove_webhook()
-    bot.set_webhook(url=APP_HOST + BOT_TOKEN)
+    bot.set_webhook(url=APP_HOST + BOT_TOKEN, secret_token=WEBHOOK_SECRET)
     logging.info(f"Webhook for {BOT_TOKEN} was set on {APP_HOST + BOT_TOKEN}")
@@ -1,6 +1,9 @@
 #!/bin/bash
 python database_setup.py &&\
+python database_migration.py &&\
 python database_initiation.py &&\
 cron &&\
+(python dispatcher_worker.py &) &&\
+(python updates_worker.py &) &&\
 python set_webhook.py &&\
 uwsgi --ini redeye_records_bot.ini
\ No newline at end of file
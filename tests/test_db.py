@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#  config reads environment on import
+os.environ.setdefault("ADMIN_CHAT_ID", "1")
+
+import database_setup  # noqa: E402
+from app import parser, delivery, updates, media, audience  # noqa: E402
+from app.db import Storage, SQLiteStorage, PostgresCursor  # noqa: E402
+
+
+def schema():
+    """Every CREATE statement of the app"""
+    statements = list()
+    for module in (parser, delivery, updates, media, audience, database_setup):
+        for name, value in vars(module).items():
+            if name.startswith("create_") and isinstance(value, str):
+                statements.append(value)
+            elif name.startswith("create_") and isinstance(value, list):
+                statements.extend(value)
+    return statements
+
+
+class StorageTest(unittest.TestCase):
+    def test_storage_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Storage()
+
+    def test_schema_runs_on_sqlite(self):
+        storage = SQLiteStorage(":memory:")
+        with storage.connection() as db_connection:
+            for statement in schema():
+                db_connection.execute(statement)
+        storage.close()
+
+
+class PostgresTranslationTest(unittest.TestCase):
+    translate = staticmethod(PostgresCursor.translate)
+
+    def test_parameters(self):
+        self.assertEqual(
+            self.translate("SELECT title FROM releases WHERE redeye_id = ? AND genre = ?"),
+            "SELECT title FROM releases WHERE redeye_id = %s AND genre = %s"
+        )
+
+    def test_percent_is_escaped(self):
+        self.assertEqual(
+            self.translate("SELECT count(*) FROM releases WHERE price LIKE '%£%' AND redeye_id > ?"),
+            "SELECT count(*) FROM releases WHERE price LIKE '%%£%%' AND redeye_id > %s"
+        )
+
+    def test_integer_primary_key(self):
+        self.assertEqual(
+            self.translate("CREATE TABLE t (job_id INTEGER PRIMARY KEY, redeye_id INT NOT NULL)"),
+            "CREATE TABLE t (job_id BIGSERIAL PRIMARY KEY, redeye_id INT NOT NULL)"
+        )
+
+    def test_real(self):
+        self.assertEqual(
+            self.translate("CREATE TABLE t (created_at REAL, realm VARCHAR)"),
+            "CREATE TABLE t (created_at DOUBLE PRECISION, realm VARCHAR)"
+        )
+
+    def test_without_rowid(self):
+        self.assertEqual(
+            self.translate("CREATE TABLE t (a INT, PRIMARY KEY (a)) WITHOUT ROWID;"),
+            "CREATE TABLE t (a INT, PRIMARY KEY (a)) ;"
+        )
+
+    def test_schema_has_no_sqlite_only_syntax(self):
+        for statement in schema():
+            translated = self.translate(statement)
+            for sqlite_only in (r"\?", r"\bWITHOUT ROWID\b", r"\bINTEGER PRIMARY KEY\b", r"\bREAL\b", r"\bAUTOINCREMENT\b"):
+                self.assertIsNone(re.search(sqlite_only, translated), translated)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#  config reads environment on import, tests never touch the bot database
+TMP = tempfile.TemporaryDirectory()
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(TMP.name, 'test.db')}"
+os.environ.setdefault("ADMIN_CHAT_ID", "1")
+
+from app.db import connect  # noqa: E402
+from app.parser import Parser  # noqa: E402
+
+
+GENRE = "HOUSE / DISCO"
+PARSER_JSON = {
+    GENRE: {
+        "New Releases": {"url": "https://www.redeyerecords.co.uk/house-disco/new-releases", "table": "house_new"},
+        "Sale": {"url": "https://www.redeyerecords.co.uk/house-disco/sale", "table": "house_sale"},
+    }
+}
+
+
+def release(redeye_id, status="In Stock"):
+    return redeye_id, f"Artist - Title {redeye_id}", "CAT – Label", "A1 Track", "£9.99", f"/{redeye_id}", "", "", status
+
+
+class ProcessSectionTest(unittest.TestCase):
+    """A release is notified once per genre, whatever order its sections are processed in"""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        parser_json = os.path.join(self.tmp.name, "parser.json")
+        with open(parser_json, "w") as f:
+            json.dump(PARSER_JSON, f)
+        with mock.patch("app.parser.PARSER_JSON", parser_json):
+            self.parser = Parser()
+        self.notified = list()
+        self.parser.notify_api = lambda table, genre, section, releases: self.notified.extend(
+            (table, release[0]) for release in releases
+        )
+        self.db_connection = connect(f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}")
+        self.db_cursor = self.db_connection.cursor()
+        Parser.create_releases_tables(self.db_cursor)
+
+    def tearDown(self):
+        self.db_connection.close()
+        self.parser.http.close()
+        self.parser.api.close()
+        self.tmp.cleanup()
+
+    def process(self, section, releases):
+        self.parser.process_section(self.db_connection, self.db_cursor, GENRE, section, releases)
+
+    def test_sale_before_new_releases(self):
+        self.process("Sale", [release(1, "Out Of Stock"), release(2)])
+        self.process("New Releases", [release(1), release(2), release(3)])
+        self.assertEqual(self.notified, [("house_sale", 2), ("house_new", 1), ("house_new", 3)])
+
+    def test_new_releases_before_sale(self):
+        self.process("New Releases", [release(1), release(2), release(3)])
+        self.process("Sale", [release(1, "Out Of Stock"), release(2)])
+        self.assertEqual(self.notified, [("house_new", 1), ("house_new", 2), ("house_new", 3)])
+
+    def test_out_of_stock_sale_release_is_not_notified(self):
+        self.process("Sale", [release(1, "Out Of Stock")])
+        self.process("Sale", [release(1, "Out Of Stock")])
+        self.assertEqual(self.notified, [])
+
+    def test_release_listed_twice_is_notified_once(self):
+        self.process("New Releases", [release(1), release(1)])
+        self.assertEqual(self.notified, [("house_new", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
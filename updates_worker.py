@@ -0,0 +1,50 @@
+#!/usr/bin/python
+
+import sys
+import signal
+import logging
+import argparse
+import threading
+
+from config import UPDATES_POLL_INTERVAL
+from app.bot import bot
+from app.updates import UpdateProcessor
+from app.worker import acquire_lock, setup_logging
+
+
+def daemon(p, interval):
+    """Resident updates worker: polls updates queue, graceful SIGTERM"""
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logging.info(f"Signal {signum} received. Stopping updates worker")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logging.info("Updates worker started")
+    while not stop.is_set():
+        try:
+            p.poll(stop, interval)
+        except Exception as e:
+            logging.critical(e)
+            stop.wait(interval)
+    p.close()
+    logging.info("Updates worker stopped")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Redeye Records bot updates worker")
+    arg_parser.add_argument("--interval", type=float, default=UPDATES_POLL_INTERVAL, help="seconds between queue polls")
+    args = arg_parser.parse_args()
+
+    setup_logging("updates_worker")
+
+    #  only one worker handles updates, so updates of a chat keep their order
+    lock = acquire_lock("updates_worker")
+    if lock is None:
+        logging.warning("Another updates worker is running. Exit")
+        sys.exit(0)
+
+    daemon(UpdateProcessor(bot), args.interval)